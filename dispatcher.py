@@ -0,0 +1,435 @@
+# dispatcher.py — multi-process front end for server.py (SERVER_WORKERS > 1).
+#
+# Starts SERVER_WORKERS copies of server.py on the ports following SERVER_PORT,
+# each loading its own models (optionally pinned to a CPU set), and forwards
+# every client connection to one of them at the TCP level:
+#
+#   /ws/transcribe                 → worker with the fewest live sessions; the
+#                                    WebSocket stays on that worker (sticky)
+#   /transcribe-file, -full        → worker with the fewest HTTP jobs in flight
+#   POST/DELETE /speakers…         → first worker that accepts the change (a
+#                                    session speaker: the worker named in the
+#                                    request), then every other worker reloads
+#                                    the profile store
+#   /trace/{id}                    → whichever worker recorded that session
+#   /health, /shutdown             → answered here
+#
+# A worker that exits, or stops answering health checks, is restarted, with
+# back-off when it keeps crashing.
+# Only the standard library is used: this process never loads a model.
+
+import asyncio
+import json
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+SERVER_PY          = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'server.py')
+HEALTH_INTERVAL_S  = 2.0
+HEALTH_TIMEOUT_S   = 5.0
+HEALTH_FAILURES    = 3      # consecutive unanswered health checks → restart the worker
+EXCHANGE_TIMEOUT_S = 60.0   # speaker writes may embed a voice sample first
+STABLE_UPTIME_S    = 30.0   # a worker that lived this long is not crash-looping
+MAX_BACKOFF_S      = 60.0
+
+# ─── Helpers ──────────────────────────────────────────────────────────────────
+
+def _parse_cpus(spec, workers):
+    """
+    SERVER_WORKER_CPUS → one CPU set (or None) per worker.
+      ''              no pinning
+      'auto'          split the CPUs this process may use evenly across workers
+      '0-3;4-7'       explicit sets, one per worker (reused round-robin)
+    """
+    spec = (spec or '').strip().lower()
+    if not spec:
+        return [None] * workers
+    if not hasattr(os, 'sched_setaffinity'):
+        print("[dispatcher] CPU affinity is not supported on this platform — ignored.")
+        return [None] * workers
+    if spec == 'auto':
+        cpus = sorted(os.sched_getaffinity(0))
+        per  = max(1, len(cpus) // workers)
+        return [set(cpus[i * per:(i + 1) * per]) or {cpus[i % len(cpus)]} for i in range(workers)]
+    groups = []
+    for group in spec.split(';'):
+        cpus = set()
+        for part in group.split(','):
+            part = part.strip()
+            if '-' in part:
+                lo, hi = part.split('-', 1)
+                cpus.update(range(int(lo), int(hi) + 1))
+            elif part:
+                cpus.add(int(part))
+        groups.append(cpus)
+    return [groups[i % len(groups)] for i in range(workers)]
+
+def _parse_head(head):
+    """Request head bytes → (method, path, {lower-case header: value})."""
+    lines = head.decode('latin-1').split('\r\n')
+    method, target = lines[0].split(' ', 2)[:2]
+    headers = {}
+    for line in lines[1:]:
+        if ':' in line:
+            k, v = line.split(':', 1)
+            headers[k.strip().lower()] = v.strip()
+    return method, target.split('?', 1)[0], headers
+
+def _close_after(head):
+    """Rewrite a request head so the worker closes the connection after replying.
+
+    One request per upstream connection keeps the in-flight counts exact and
+    lets every request be routed on its own.
+    """
+    lines = [l for l in head[:-4].split(b'\r\n') if not l.lower().startswith(b'connection:')]
+    return b'\r\n'.join(lines + [b'Connection: close']) + b'\r\n\r\n'
+
+def _json_response(status, payload):
+    body   = json.dumps(payload).encode()
+    reason = {200: 'OK', 400: 'Bad Request', 502: 'Bad Gateway', 503: 'Service Unavailable'}.get(status, '')
+    return (f"HTTP/1.1 {status} {reason}\r\ncontent-type: application/json\r\n"
+            f"content-length: {len(body)}\r\nconnection: close\r\n\r\n").encode() + body
+
+async def _exchange(port, head, body=b'', timeout=EXCHANGE_TIMEOUT_S):
+    """
+    Send one request to a worker and return (status, raw response bytes).
+    Raises OSError when it can't be reached, asyncio.TimeoutError when it has
+    not answered within `timeout` seconds.
+    """
+    deadline = time.monotonic() + timeout
+    reader, writer = await asyncio.wait_for(asyncio.open_connection('127.0.0.1', port), timeout)
+    try:
+        writer.write(_close_after(head) + body)
+        await asyncio.wait_for(writer.drain(), deadline - time.monotonic())
+        # The worker closes after replying.
+        response = await asyncio.wait_for(reader.read(), deadline - time.monotonic())
+    finally:
+        writer.close()
+    try:
+        return int(response.split(b' ', 2)[1]), response
+    except (IndexError, ValueError):
+        return 502, _json_response(502, {'error': 'Invalid response from worker'})
+
+async def _copy(src, dst):
+    try:
+        while True:
+            data = await src.read(65536)
+            if not data:
+                break
+            dst.write(data)
+            await dst.drain()
+        if dst.can_write_eof():
+            dst.write_eof()
+    except (ConnectionError, OSError):
+        pass
+
+# ─── Workers ──────────────────────────────────────────────────────────────────
+
+class _Worker:
+    """One server.py child process and the dispatcher's view of its load."""
+
+    def __init__(self, index, port, cpus):
+        self.index       = index
+        self.port        = port
+        self.cpus        = cpus
+        self.proc        = None
+        self.started     = 0.0
+        self.restarts    = 0
+        self.crashes     = 0      # consecutive short-lived runs → back-off
+        self.restart_at  = None
+        self.ready       = False
+        self.health      = {}
+        self.ws_sessions = 0
+        self.http_jobs   = 0
+        self.unanswered  = 0      # consecutive health checks that timed out
+
+    @property
+    def alive(self):
+        return self.proc is not None and self.proc.poll() is None
+
+    def start(self):
+        env = dict(os.environ, SERVER_WORKERS='1', SERVER_PORT=str(self.port),
+                   SERVER_WORKER_INDEX=str(self.index), PYTHONUNBUFFERED='1')
+        preexec = None
+        if self.cpus:
+            # Size the math libraries' thread pools to the pinned CPU set.
+            env.setdefault('OMP_NUM_THREADS', str(len(self.cpus)))
+            cpus    = self.cpus
+            preexec = lambda: os.sched_setaffinity(0, cpus)
+        self.proc = subprocess.Popen(
+            [sys.executable, SERVER_PY], env=env, preexec_fn=preexec,
+            stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, errors='replace', bufsize=1,
+        )
+        self.started    = time.monotonic()
+        self.restart_at = None
+        self.ready      = False
+        self.unanswered = 0
+        threading.Thread(target=self._relay_output, args=(self.proc,), daemon=True).start()
+        pinned = f" on CPUs {sorted(self.cpus)}" if self.cpus else ''
+        print(f"[dispatcher] Worker {self.index} started (PID {self.proc.pid}, port {self.port}{pinned}).")
+
+    def _relay_output(self, proc):
+        for line in proc.stdout:
+            print(f"[worker {self.index}] {line}", end='')
+
+    def stop(self, timeout=10.0):
+        if not self.alive:
+            return
+        self.proc.terminate()
+        try:
+            self.proc.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            self.proc.kill()
+            self.proc.wait()
+
+    def status(self):
+        return {
+            'index':         self.index,
+            'port':          self.port,
+            'pid':           self.proc.pid if self.proc else None,
+            'alive':         self.alive,
+            'ready':         self.ready,
+            'restarts':      self.restarts,
+            'ws_sessions':   self.ws_sessions,
+            'http_jobs':     self.http_jobs,
+            'transcription': self.health.get('transcription'),
+            'result_cache':  self.health.get('result_cache'),
+        }
+
+# ─── Dispatcher ───────────────────────────────────────────────────────────────
+
+class Dispatcher:
+    def __init__(self, host, port, workers, cpus=''):
+        self.host           = host
+        self.port           = port
+        cpu_sets            = _parse_cpus(cpus, workers)
+        self.workers        = [_Worker(i, port + 1 + i, cpu_sets[i]) for i in range(workers)]
+        self._stop          = None
+        self._speakers_lock = None   # one profile-store write at a time, across workers
+        self.stopping       = False
+
+    def _pick(self, kind):
+        """Least-loaded live worker (ready ones first) for a 'ws' or 'http' connection."""
+        candidates = [w for w in self.workers if w.alive and w.ready] or \
+                     [w for w in self.workers if w.alive]
+        if not candidates:
+            return None
+        if kind == 'ws':
+            return min(candidates, key=lambda w: (w.ws_sessions, w.http_jobs))
+        return min(candidates, key=lambda w: (w.http_jobs, w.ws_sessions))
+
+    async def _handle(self, reader, writer):
+        try:
+            head = await reader.readuntil(b'\r\n\r\n')
+            method, path, headers = _parse_head(head)
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError, ValueError):
+            writer.close()
+            return
+        try:
+            if path == '/health':
+                writer.write(_json_response(200, self.health()))
+            elif path == '/shutdown':
+                writer.write(_json_response(200, {'status': 'shutting down'}))
+                self._stop.set()
+            elif headers.get('upgrade', '').lower() == 'websocket':
+                await self._pipe('ws', head, headers, reader, writer)
+            elif path in ('/transcribe-file', '/transcribe-full'):
+                await self._pipe('http', head, headers, reader, writer)
+            elif path.startswith('/speakers') and method in ('POST', 'DELETE', 'PUT'):
+                body = await reader.readexactly(int(headers.get('content-length', 0) or 0))
+                async with self._speakers_lock:
+                    writer.write(await self._write_speakers(method, path, head, body))
+            elif path.startswith('/trace/'):
+                writer.write(await self._find_trace(head))
+            else:
+                await self._pipe(None, head, headers, reader, writer)
+            await writer.drain()
+        except (ConnectionError, OSError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _pipe(self, kind, head, headers, reader, writer):
+        """Splice the client connection onto a worker; counts it while it lasts."""
+        worker = self._pick(kind)
+        if worker is None:
+            writer.write(_json_response(503, {'error': 'No worker available'}))
+            return
+        try:
+            up_reader, up_writer = await asyncio.wait_for(
+                asyncio.open_connection('127.0.0.1', worker.port), HEALTH_TIMEOUT_S)
+        except (OSError, asyncio.TimeoutError):
+            writer.write(_json_response(502, {'error': f'Worker {worker.index} unreachable'}))
+            return
+        counter = {'ws': 'ws_sessions', 'http': 'http_jobs'}.get(kind)
+        if counter:
+            setattr(worker, counter, getattr(worker, counter) + 1)
+        try:
+            up_writer.write(head if kind == 'ws' else _close_after(head))
+            upstream = asyncio.ensure_future(_copy(reader, up_writer))
+            # The worker's side decides when the exchange is over (response
+            # sent, or WebSocket closed after the client went away).
+            await _copy(up_reader, writer)
+            upstream.cancel()
+        finally:
+            if counter:
+                setattr(worker, counter, getattr(worker, counter) - 1)
+            up_writer.close()
+
+    async def _write_speakers(self, method, path, head, body):
+        """
+        Enroll / remove a profile, then make every other worker reload the
+        shared profile store.  A session speaker ({"speaker": ...}) only exists
+        on the worker that ran the session, so that enroll must name it
+        ("worker", from the session's "session" message); anything else goes to
+        the first worker that accepts it.  Called under _speakers_lock: each
+        worker rewrites the whole store file, so writes must not overlap.
+        """
+        if method == 'POST' and path.startswith('/speakers/enroll'):
+            try:
+                data = json.loads(body or b'{}')
+            except ValueError:
+                data = None
+            if isinstance(data, dict) and data.get('speaker'):
+                return await self._enroll_session_speaker(data.get('worker'), head, body)
+        response = _json_response(503, {'error': 'No worker available'})
+        for w in [w for w in self.workers if w.alive]:
+            try:
+                status, response = await _exchange(w.port, head, body)
+            except (OSError, asyncio.TimeoutError):
+                continue
+            if 200 <= status < 300:
+                await self._reload_others(w)
+                return response
+            if status != 404:
+                return response
+        return response
+
+    async def _enroll_session_speaker(self, index, head, body):
+        if isinstance(index, bool) or not isinstance(index, int) or not 0 <= index < len(self.workers):
+            return _json_response(400, {
+                'error': 'Enrolling a session speaker needs the "worker" index '
+                         'from that session\'s "session" message'})
+        w = self.workers[index]
+        if not w.alive:
+            return _json_response(503, {'error': f'Worker {index} is not running'})
+        try:
+            status, response = await _exchange(w.port, head, body)
+        except (OSError, asyncio.TimeoutError):
+            return _json_response(502, {'error': f'Worker {index} unreachable'})
+        if 200 <= status < 300:
+            await self._reload_others(w)
+        return response
+
+    async def _reload_others(self, worker):
+        reload = b'POST /speakers/reload HTTP/1.1\r\nHost: 127.0.0.1\r\nContent-Length: 0\r\n\r\n'
+        for other in self.workers:
+            if other is not worker and other.alive:
+                try:
+                    await _exchange(other.port, reload, timeout=HEALTH_TIMEOUT_S)
+                except (OSError, asyncio.TimeoutError):
+                    pass
+
+    async def _find_trace(self, head):
+        response = _json_response(503, {'error': 'No worker available'})
+        for w in [w for w in self.workers if w.alive]:
+            try:
+                status, response = await _exchange(w.port, head)
+            except (OSError, asyncio.TimeoutError):
+                continue
+            if status != 404:
+                return response
+        return response
+
+    def health(self):
+        workers = [w.status() for w in self.workers]
+        first   = next((w.health for w in self.workers if w.health), {})
+        return {
+            'status':        'ok',
+            'model_ready':   any(w['ready'] for w in workers),
+            'asr_precision': first.get('asr_precision'),
+            'workers':       workers,
+        }
+
+    async def _poll_health(self):
+        request = b'GET /health HTTP/1.1\r\nHost: 127.0.0.1\r\n\r\n'
+        while True:
+            for w in self.workers:
+                if not w.alive:
+                    w.ready = False
+                    continue
+                try:
+                    status, response = await _exchange(w.port, request, timeout=HEALTH_TIMEOUT_S)
+                    w.health = json.loads(response.split(b'\r\n\r\n', 1)[1]) if status == 200 else {}
+                    w.unanswered = 0
+                except asyncio.TimeoutError:
+                    # Listening but not answering: a wedged event loop.  Refused
+                    # connections don't count — the port opens only after start-up.
+                    w.health = {}
+                    w.unanswered += 1
+                    if w.unanswered >= HEALTH_FAILURES and w.alive:
+                        print(f"[dispatcher] Worker {w.index} did not answer {w.unanswered} health "
+                              f"checks — killing it.")
+                        w.proc.kill()
+                except (OSError, ValueError, IndexError):
+                    w.health = {}
+                w.ready = bool(w.health.get('model_ready'))
+            await asyncio.sleep(HEALTH_INTERVAL_S)
+
+    async def _supervise(self):
+        """Restart workers that exited; back off when one keeps crashing at start-up."""
+        while True:
+            await asyncio.sleep(1.0)
+            now = time.monotonic()
+            for w in self.workers:
+                if self.stopping or w.alive:
+                    continue
+                if w.restart_at is None:
+                    w.crashes = w.crashes + 1 if now - w.started < STABLE_UPTIME_S else 1
+                    delay = min(MAX_BACKOFF_S, 2.0 ** (w.crashes - 1))
+                    w.restart_at = now + delay
+                    print(f"[dispatcher] Worker {w.index} exited (code {w.proc.returncode}) — "
+                          f"restarting in {delay:.0f} s.")
+                elif now >= w.restart_at:
+                    w.restarts += 1
+                    w.start()
+
+    def stop_workers(self):
+        self.stopping = True
+        for w in self.workers:
+            if w.alive:
+                w.proc.terminate()
+        for w in self.workers:
+            w.stop()
+
+    async def serve(self):
+        loop = asyncio.get_running_loop()
+        self._stop = asyncio.Event()
+        self._speakers_lock = asyncio.Lock()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, self._stop.set)
+            except (NotImplementedError, RuntimeError):
+                pass   # Windows: Ctrl+C raises KeyboardInterrupt instead
+        for w in self.workers:
+            w.start()
+        server = await asyncio.start_server(self._handle, self.host, self.port)
+        print(f"[dispatcher] Listening on {self.host}:{self.port} → {len(self.workers)} workers.")
+        tasks = [asyncio.create_task(self._supervise()), asyncio.create_task(self._poll_health())]
+        async with server:
+            await self._stop.wait()
+        for t in tasks:
+            t.cancel()
+        await loop.run_in_executor(None, self.stop_workers)
+
+def main(host, port, workers, cpus=''):
+    dispatcher = Dispatcher(host, port, workers, cpus)
+    try:
+        asyncio.run(dispatcher.serve())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        dispatcher.stop_workers()
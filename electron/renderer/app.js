@@ -531,7 +531,9 @@ function connectWS() {
   ws.onmessage = (evt) => {
     try {
       const msg = JSON.parse(evt.data);
-      if (msg.type === 'transcript') handleTranscript(msg);
+      if      (msg.type === 'transcript')     handleTranscript(msg);
+      else if (msg.type === 'speaker_remap')  handleSpeakerRemap(msg.map || {});
+      else if (msg.type === 'speaker_update') handleSpeakerUpdate(msg.updates || []);
     } catch (e) { console.warn('[ws]', e); }
   };
 
@@ -584,6 +586,32 @@ function handleTranscript(msg) {
   }
 }
 
+// Server merged duplicate speakers: { old_id: kept_id }. Relabel in place and
+// carry a user-given name over to the kept ID if it has none yet.
+function handleSpeakerRemap(map) {
+  if (isRetranscribing) return;
+  for (const [oldId, newId] of Object.entries(map)) {
+    if (speakerNames[oldId] && !speakerNames[newId]) speakerNames[newId] = speakerNames[oldId];
+  }
+  for (const s of allSentences) {
+    if (s.speaker && map[s.speaker]) s.speaker = map[s.speaker];
+  }
+  renderTranscriptDisplay();
+  renderSpeakersPanel();
+  renderTimestamps();
+}
+
+// Background diarization labelled already-sent sentences: [[index, speaker], …]
+function handleSpeakerUpdate(updates) {
+  if (isRetranscribing) return;
+  for (const [i, spk] of updates) {
+    if (allSentences[i]) allSentences[i].speaker = spk;
+  }
+  renderTranscriptDisplay();
+  renderSpeakersPanel();
+  renderTimestamps();
+}
+
 function renderTranscriptDisplay() {
   const div = document.getElementById('transcript-display');
   if (!div) return;
@@ -652,6 +680,8 @@ function renderSpeakersPanel() {
 
 // ─── Speaker helpers ──────────────────────────────────────────────────────────
 function toFriendlyLabel(id) {
+  // Enrolled voice profiles come back from the server already named ("Alice").
+  if (!id.startsWith('SPEAKER_')) return id;
   const n = parseInt(id.replace('SPEAKER_', ''), 10);
   return `Speaker ${n + 1}`;
 }
@@ -660,6 +690,12 @@ function getDisplayName(id) {
   return speakerNames[id] || toFriendlyLabel(id);
 }
 function getSpeakerIndex(id) {
+  if (!id.startsWith('SPEAKER_')) {
+    // Stable color for enrolled (named) speakers
+    let h = 0;
+    for (const c of id) h = (h * 31 + c.charCodeAt(0)) >>> 0;
+    return h;
+  }
   return parseInt(id.replace('SPEAKER_', ''), 10) || 0;
 }
 
@@ -1,14 +1,19 @@
 import asyncio
+import collections
 import concurrent.futures as _cf
+import hashlib
 import json
+import math
 import numpy as np
 import os
 import platform as _sys_platform
 import queue
 import struct
 import sys
+import tempfile
 import threading
 import time
+import uuid
 import warnings
 import wave
 
@@ -26,11 +31,33 @@ warnings.filterwarnings('ignore', message=r'.*Redirecting import of pytorch_ligh
 from dotenv import load_dotenv
 load_dotenv()
 
+# ─── Multi-process serving ────────────────────────────────────────────────────
+# SERVER_HOST / SERVER_PORT : address the app connects to.
+# SERVER_WORKERS : > 1 turns this process into a lightweight dispatcher
+#   (dispatcher.py) that starts that many copies of this server on the next
+#   ports, each with its own models, and forwards connections to them.
+#   Decided here, before any model is loaded in this process.
+# SERVER_WORKER_CPUS : optional CPU pinning for the workers — 'auto' splits the
+#   available CPUs evenly, '0-3;4-7' gives one explicit set per worker.
+# SERVER_WORKER_INDEX : set by the dispatcher on each worker; sent to the app in
+#   the WebSocket "session" message so that enrolling one of that session's
+#   speakers can be routed back to the worker that holds it.
+SERVER_HOST        = os.environ.get('SERVER_HOST', '127.0.0.1')
+SERVER_PORT        = int(os.environ.get('SERVER_PORT', '8765'))
+SERVER_WORKERS     = int(os.environ.get('SERVER_WORKERS', '1'))
+SERVER_WORKER_CPUS = os.environ.get('SERVER_WORKER_CPUS', '')
+SERVER_WORKER_INDEX = os.environ.get('SERVER_WORKER_INDEX')
+
+if __name__ == '__main__' and SERVER_WORKERS > 1:
+    import dispatcher
+    dispatcher.main(SERVER_HOST, SERVER_PORT, SERVER_WORKERS, SERVER_WORKER_CPUS)
+    sys.exit(0)
+
 # ─── Platform detection ───────────────────────────────────────────────────────
 def _detect_backend():
-    """MLX on Apple Silicon, ONNX everywhere else."""
-    if os.environ.get('PARAKEET_BACKEND', '').lower() == 'onnx':
-        return 'onnx'
+    """MLX on Apple Silicon, ONNX everywhere else (stub only when requested)."""
+    if os.environ.get('PARAKEET_BACKEND', '').lower() in ('onnx', 'stub'):
+        return os.environ['PARAKEET_BACKEND'].lower()
     if sys.platform == 'darwin' and _sys_platform.machine() == 'arm64':
         try:
             import mlx.core  # noqa — check MLX is installed
@@ -40,7 +67,7 @@ def _detect_backend():
     return 'onnx'
 
 BACKEND = _detect_backend()
-print(f"[backend] {'MLX (Apple Silicon)' if BACKEND == 'mlx' else 'ONNX Runtime'}")
+print(f"[backend] {({'mlx': 'MLX (Apple Silicon)', 'stub': 'Stub (load testing)'}).get(BACKEND, 'ONNX Runtime')}")
 
 if BACKEND == 'onnx':
     import onnxruntime as _ort
@@ -51,10 +78,9 @@ if BACKEND == 'onnx':
         providers = ['CPUExecutionProvider']
 
 import subprocess
-import tempfile
 
 from fastapi import FastAPI, Request, WebSocket, WebSocketDisconnect
-from fastapi.responses import JSONResponse
+from fastapi.responses import FileResponse, JSONResponse
 
 # ─── Configuration ────────────────────────────────────────────────────────────
 SAMPLE_RATE   = 16000
@@ -76,19 +102,178 @@ DIAR_MATCH_THRESHOLD = float(os.environ.get('DIAR_MATCH_THRESHOLD', '0.45'))
 DIAR_MERGE_THRESHOLD = float(os.environ.get('DIAR_MERGE_THRESHOLD', '0.65'))
 DIAR_MIN_SEGMENT_S   = float(os.environ.get('DIAR_MIN_SEGMENT_S',   '1.0'))
 DIAR_CONTEXT_S       = float(os.environ.get('DIAR_CONTEXT_S',       '2.0'))
+# DIAR_EMB_BATCH_S : common length (seconds) every speaker segment is centre-
+#   cropped or tiled to so all of a window's embeddings run as one batched
+#   forward pass.  0 → one forward pass per segment at its natural length.
+DIAR_EMB_BATCH_S     = float(os.environ.get('DIAR_EMB_BATCH_S',     '3.0'))
+# DIAR_MAX_WINDOW_S : upper bound (seconds) on the window built when the live
+#   diarization scheduler coalesces several pending chunks into one pyannote call.
+DIAR_MAX_WINDOW_S    = float(os.environ.get('DIAR_MAX_WINDOW_S',    '30.0'))
+
+# Stub backend — PARAKEET_BACKEND=stub replaces the models with stand-ins of
+# configurable cost so tools/loadtest_ws.py can measure the serving path
+# (WebSocket, queues, threads, scheduling) without a GPU or model downloads.
+# STUB_ASR_RTF  : seconds of work per second of audio for one ASR call.
+# STUB_DIAR_RTF : same for one diarization window; 0 disables diarization.
+STUB_ASR_RTF  = float(os.environ.get('STUB_ASR_RTF',  '0.05'))
+STUB_DIAR_RTF = float(os.environ.get('STUB_DIAR_RTF', '0'))
+
+def _stub_work(seconds):
+    """Hold the calling thread for `seconds`, burning CPU like a real model would."""
+    # Matrix products release the GIL, as ONNX Runtime / torch kernels do.
+    m = np.ones((128, 128), dtype=np.float32)
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        m @ m
 
 # Mutex that serialises ALL _diar_pipeline calls across threads.
 # pyannote's pipeline is not thread-safe: concurrent calls from the WS
 # diarization pool and /transcribe-full would cause heap corruption or wrong
-# results.  Each session creates its own ThreadPoolExecutor (see ws_transcribe)
+# results.  Each session creates its own _DiarScheduler (see ws_transcribe)
 # so there is no cross-session backlog.
 _pipeline_lock = threading.Lock()
 
+# ─── Session tracing (opt-in) ─────────────────────────────────────────────────
+# TRACE_SESSIONS : 1 → record pipeline spans for every WS session.  A client can
+#   also opt in for one session with {"type": "config", "trace": true}.
+# TRACE_DIR : when set, each traced session is written there as
+#   trace-<session_id>.json on stop (open in chrome://tracing or Perfetto).
+# The last TRACE_KEEP traces are also served by GET /trace/{session_id} — from
+#   memory, or from TRACE_DIR once written there (the tracer is then dropped).
+# TRACE_MAX_EVENTS : spans kept per session; beyond it the oldest are dropped
+#   (every audio frame adds one or two, so long sessions would grow unbounded).
+TRACE_SESSIONS   = os.environ.get('TRACE_SESSIONS', '0').strip().lower() in ('1', 'true', 'yes')
+TRACE_DIR        = os.environ.get('TRACE_DIR', '').strip()
+TRACE_KEEP       = 20
+TRACE_MAX_EVENTS = int(os.environ.get('TRACE_MAX_EVENTS', '100000'))
+
+class _Tracer:
+    """
+    Collects complete ('X') events in Chrome trace-event format.
+
+    Spans carry their own args (chunk index, audio offset…) so one chunk can
+    be followed through audio_q → resampling → ASR → diarization → send.
+    A disabled tracer costs one attribute check per span.
+    """
+
+    def __init__(self, session_id=None, enabled=False):
+        self.session_id = session_id
+        self.enabled    = enabled
+        self._events    = collections.deque(maxlen=TRACE_MAX_EVENTS)
+        self.dropped    = 0      # oldest events pushed out of the full buffer
+        self._threads   = {}
+        self._lock      = threading.Lock()
+        self._t0        = time.perf_counter()
+
+    def _us(self, t):
+        return round((t - self._t0) * 1e6, 1)
+
+    def record(self, name, t_start, t_end, **args):
+        """Add a span measured by the caller (time.perf_counter() values)."""
+        if not self.enabled:
+            return
+        th = threading.current_thread()
+        with self._lock:
+            self._threads.setdefault(th.ident, th.name)
+            if len(self._events) == self._events.maxlen:
+                self.dropped += 1
+            self._events.append({
+                'name': name, 'cat': 'pipeline', 'ph': 'X',
+                'ts': self._us(t_start), 'dur': self._us(t_end) - self._us(t_start),
+                'pid': os.getpid(), 'tid': th.ident, 'args': args,
+            })
+
+    def span(self, name, **args):
+        return _TraceSpan(self, name, args)
+
+    def to_chrome(self):
+        with self._lock:
+            meta = [
+                {'name': 'thread_name', 'ph': 'M', 'pid': os.getpid(), 'tid': tid,
+                 'args': {'name': tname}}
+                for tid, tname in self._threads.items()
+            ]
+            return {
+                'traceEvents':     meta + list(self._events),
+                'displayTimeUnit': 'ms',
+                'otherData':       {'session_id': self.session_id, 'backend': BACKEND,
+                                    'dropped_events': self.dropped},
+            }
+
+    def dump(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"trace-{self.session_id}.json")
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_chrome(), f)
+        return path
+
+class _TraceSpan:
+    __slots__ = ('tracer', 'name', 'args', 't0')
+
+    def __init__(self, tracer, name, args):
+        self.tracer, self.name, self.args = tracer, name, args
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.tracer.record(self.name, self.t0, time.perf_counter(), **self.args)
+        return False
+
+_NULL_TRACER = _Tracer()
+_traces      = {}   # { session_id: _Tracer } — insertion-ordered, capped at TRACE_KEEP
+_traces_lock = threading.Lock()
+
+def _keep_trace(tracer):
+    with _traces_lock:
+        _traces[tracer.session_id] = tracer
+        while len(_traces) > TRACE_KEEP:
+            del _traces[next(iter(_traces))]
+
+def _trace_path(session_id):
+    """TRACE_DIR file of a dumped session, or None."""
+    if not TRACE_DIR or not session_id.isalnum():
+        return None
+    path = os.path.join(TRACE_DIR, f"trace-{session_id}.json")
+    return path if os.path.isfile(path) else None
+
+# ─── Cooperative cancellation ─────────────────────────────────────────────────
+# Work whose client went away (aborted fetch, closed WebSocket) is stopped at
+# the next chunk boundary instead of running to the end.  A model call that has
+# already started always completes; only the work after it is skipped.
+
+class _Cancelled(Exception):
+    """Raised by _CancelToken.check() once the work was abandoned."""
+
+class _CancelToken(threading.Event):
+    """Set by the request side, checked by the threads doing its work."""
+
+    def check(self):
+        if self.is_set():
+            raise _Cancelled()
+
 # ─── ASR model (loaded once) ──────────────────────────────────────────────────
 _asr_model      = None
 _asr_model_lock = threading.Lock()
 _model_ready    = False
 
+# ASR precision (ONNX backend only) — overridable via .env
+# ASR_PRECISION : fp32 (default) loads the full-precision Parakeet model.
+#   int8 loads a dynamically quantized INT8 encoder/decoder on CPUExecutionProvider
+#   (much faster on CPU-only hosts, slightly less accurate).
+#   auto picks int8 when no CUDA provider is available, fp32 otherwise.
+#   Use tools/eval_asr_precision.py to measure the trade-off on your own audio.
+# ASR_INT8_DIR : where the INT8 model is written when it has to be produced
+#   locally (first use, when the hub does not ship pre-quantized files).
+ASR_MODEL_NAME = "nemo-parakeet-tdt-0.6b-v3"
+ASR_FP32_REPO  = "istupakov/parakeet-tdt-0.6b-v3-onnx"
+ASR_PRECISION  = os.environ.get('ASR_PRECISION', 'fp32').strip().lower()
+ASR_INT8_DIR   = os.environ.get(
+    'ASR_INT8_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models', 'parakeet-tdt-0.6b-v3-int8'),
+)
+
 # ─── MLX single-thread executor ───────────────────────────────────────────────
 # Metal (MLX GPU) requires all GPU calls to happen on the same thread that
 # initialized the Metal context.  Calling from arbitrary threads causes
@@ -135,8 +320,83 @@ if BACKEND == 'mlx':
             raise box['error']
         return box['result']
 
+def _resolve_precision(precision=None):
+    """Map an ASR_PRECISION value (fp32 / int8 / auto) to 'fp32' or 'int8'."""
+    precision = (precision or ASR_PRECISION).lower()
+    if precision == 'auto':
+        return 'fp32' if 'CUDAExecutionProvider' in providers else 'int8'
+    if precision not in ('fp32', 'int8'):
+        print(f"[asr] Unknown ASR_PRECISION={precision!r} — using fp32.")
+        return 'fp32'
+    return precision
+
+# Resolved once — /health and the result cache report it on every request.
+_asr_precision = _resolve_precision() if BACKEND == 'onnx' else None
+
+def _quantize_asr_model(dst_dir):
+    """
+    Produce an INT8 copy of the Parakeet ONNX model in dst_dir.
+
+    The fp32 files are fetched from the HuggingFace cache (downloaded if
+    needed), the encoder and decoder/joint graphs are dynamically quantized
+    (weights → INT8, activations quantized at runtime) and the remaining files
+    (vocab, config, preprocessor) are copied unchanged.  onnx-asr looks for
+    '*.int8.onnx' names when loaded with quantization='int8'.
+    """
+    import shutil
+    from huggingface_hub import snapshot_download
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    quantized = ('encoder-model.onnx', 'decoder_joint-model.onnx')
+    src_dir = snapshot_download(ASR_FP32_REPO, ignore_patterns=['*.int8.onnx'])
+    os.makedirs(dst_dir, exist_ok=True)
+    for name in os.listdir(src_dir):
+        src = os.path.join(src_dir, name)
+        if name in quantized:
+            dst = os.path.join(dst_dir, name.replace('.onnx', '.int8.onnx'))
+            print(f"[asr] Quantizing {name} → {os.path.basename(dst)} (one-time)…")
+            quantize_dynamic(
+                src, dst,
+                weight_type=QuantType.QInt8,
+                use_external_data_format=True,   # fp32 encoder exceeds the 2 GB protobuf limit
+            )
+        elif not name.startswith(quantized) and os.path.isfile(src):
+            # vocab, config and the mel preprocessor are used as-is
+            shutil.copy2(src, os.path.join(dst_dir, name))
+
+def _load_asr_model(precision=None):
+    """
+    Load the Parakeet ONNX model in the requested precision.
+
+    int8 is always run on CPUExecutionProvider.  It is loaded, in order, from
+    a local ASR_INT8_DIR produced earlier, from the hub's pre-quantized files,
+    or produced locally on first use with _quantize_asr_model().
+    """
+    precision = _resolve_precision(precision) if precision else _asr_precision
+    if precision == 'fp32':
+        print("Loading Parakeet ONNX model (fp32)…")
+        return onnx_asr.load_model(ASR_MODEL_NAME, providers=providers).with_timestamps()
+
+    cpu = ['CPUExecutionProvider']
+    print("Loading Parakeet ONNX model (int8, CPU)…")
+    if os.path.isfile(os.path.join(ASR_INT8_DIR, 'encoder-model.int8.onnx')):
+        return onnx_asr.load_model(
+            ASR_MODEL_NAME, ASR_INT8_DIR, quantization='int8', providers=cpu
+        ).with_timestamps()
+    try:
+        return onnx_asr.load_model(ASR_MODEL_NAME, quantization='int8', providers=cpu).with_timestamps()
+    except Exception as e:
+        print(f"[asr] No pre-quantized model available ({e}) — producing one in {ASR_INT8_DIR}.")
+    _quantize_asr_model(ASR_INT8_DIR)
+    return onnx_asr.load_model(
+        ASR_MODEL_NAME, ASR_INT8_DIR, quantization='int8', providers=cpu
+    ).with_timestamps()
+
 def get_model():
     global _asr_model, _model_ready
+    if BACKEND == 'stub':
+        _model_ready = True
+        return None
     if BACKEND == 'mlx':
         # Model is loaded by the MLX thread; wait until ready.
         _mlx_thread.join(timeout=0)   # non-blocking — just check
@@ -145,11 +405,7 @@ def get_model():
         return _asr_model
     with _asr_model_lock:
         if _asr_model is None:
-            print("Loading Parakeet ONNX model…")
-            _asr_model = (
-                onnx_asr.load_model("nemo-parakeet-tdt-0.6b-v3", providers=providers)
-                .with_timestamps()
-            )
+            _asr_model   = _load_asr_model()
             _model_ready = True
             print("ASR model ready.")
     return _asr_model
@@ -157,6 +413,8 @@ def get_model():
 # Pre-load ONNX model in a background thread (MLX is loaded by _mlx_thread above)
 if BACKEND == 'onnx':
     threading.Thread(target=get_model, daemon=True).start()
+elif BACKEND == 'stub':
+    get_model()
 
 # ─── Diarization pipeline (optional — requires HF_TOKEN) ──────────────────────
 
@@ -168,6 +426,14 @@ _diar_on_gpu     = False   # True only when pyannote runs on CUDA (Windows/RTX)
 
 def load_diarization():
     global _diar_pipeline, _diarization_on, _embedding_model, _diar_on_gpu
+    if BACKEND == 'stub':
+        if STUB_DIAR_RTF > 0:
+            with _diar_lock:
+                _diar_pipeline   = _StubDiarization()
+                _embedding_model = _StubEmbedding()
+                _diarization_on  = True
+            print(f"[diarization] Stub pipeline ready (RTF {STUB_DIAR_RTF}).")
+        return
     hf_token = os.environ.get('HF_TOKEN', '').strip()
     if not hf_token:
         print("[diarization] HF_TOKEN missing — diarization disabled.")
@@ -211,8 +477,212 @@ def load_diarization():
             print("[diarization] Full traceback:")
             traceback.print_exc()
 
+class _StubTurn:
+    def __init__(self, start, end):
+        self.start, self.end = start, end
+
+class _StubDiarization:
+    """
+    Stand-in for the pyannote pipeline (PARAKEET_BACKEND=stub): costs
+    STUB_DIAR_RTF × window seconds and returns fixed 4 s turns alternating
+    between two local speakers.
+    """
+
+    def __call__(self, input_dict, **kwargs):
+        audio_s = input_dict['waveform'].shape[-1] / SAMPLE_RATE
+        _stub_work(audio_s * STUB_DIAR_RTF)
+        return self._Annotation([(t, min(t + 4.0, audio_s), f"SPEAKER_{int(t // 4) % 2:02d}")
+                                 for t in np.arange(0.0, audio_s, 4.0)])
+
+    class _Annotation:
+        def __init__(self, turns):
+            self._turns = turns
+
+        def itertracks(self, yield_label=False):
+            for start, end, label in self._turns:
+                yield _StubTurn(start, end), None, label
+
+class _StubEmbedding:
+    """Stand-in speaker embedding: a fixed random projection of the log spectrum."""
+
+    def __init__(self, dim=192):
+        self._proj = np.random.default_rng(0).standard_normal((257, dim))
+
+    def _embed(self, seg):
+        frames = seg[:len(seg) - len(seg) % 512].reshape(-1, 512)
+        spec   = np.log1p(np.abs(np.fft.rfft(frames, axis=1)).mean(axis=0))
+        return spec @ self._proj
+
+    def infer(self, batch):
+        return np.stack([self._embed(np.asarray(x).reshape(-1)) for x in batch])
+
+    def __call__(self, input_dict):
+        return self._embed(np.asarray(input_dict['waveform']).reshape(-1))
+
 threading.Thread(target=load_diarization, daemon=True).start()
 
+# ─── Enrolled speaker profiles (persistent) ───────────────────────────────────
+# Named voice profiles survive restarts so known colleagues are labelled by
+# name as soon as they speak, instead of coming back as a fresh SPEAKER_n.
+# SPEAKER_PROFILES_PATH : .npz file holding names, centroids and sample counts.
+# SPEAKER_PROFILE_THRESHOLD : cosine similarity required to recognise an
+#   enrolled speaker.  Defaults to DIAR_MATCH_THRESHOLD.
+# SPEAKER_ANN_MIN_PROFILES : directory size from which the approximate
+#   nearest-neighbour index (hnswlib, optional) replaces the exact matrix
+#   lookup.  The exact lookup is a single matrix-vector product and stays well
+#   under a millisecond for a few thousand profiles.
+SPEAKER_PROFILES_PATH = os.environ.get(
+    'SPEAKER_PROFILES_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'speaker_profiles.npz'),
+)
+SPEAKER_PROFILE_THRESHOLD = float(os.environ.get('SPEAKER_PROFILE_THRESHOLD', str(DIAR_MATCH_THRESHOLD)))
+SPEAKER_ANN_MIN_PROFILES  = int(os.environ.get('SPEAKER_ANN_MIN_PROFILES', '5000'))
+
+def _l2_normalize(mat):
+    norms = np.linalg.norm(mat, axis=-1, keepdims=True)
+    return mat / np.where(norms > 0, norms, 1.0)
+
+class _SpeakerProfileStore:
+    """
+    Named speaker centroids persisted to disk, with an in-memory index.
+
+    The index is a row-normalised (N, D) float32 matrix so a lookup is one
+    matrix-vector product.  When hnswlib is installed and the directory holds
+    at least SPEAKER_ANN_MIN_PROFILES entries, an HNSW graph (cosine space) is
+    built on top and used instead.  All methods are thread-safe.
+    """
+
+    def __init__(self, path):
+        self.path      = path
+        self._lock     = threading.Lock()
+        self._names    = []     # row order of the index
+        self._centroid = {}     # { name: np.ndarray } — un-normalised running mean
+        self._count    = {}     # { name: int }
+        self._matrix   = None   # (N, D) normalised, None when empty
+        self._ann      = None
+        self._load()
+
+    def _read(self):
+        """({name: centroid}, {name: count}) as currently saved on disk."""
+        centroid, count = {}, {}
+        if os.path.isfile(self.path):
+            with np.load(self.path, allow_pickle=False) as data:
+                for name, c, n in zip(data['names'], data['centroids'], data['counts']):
+                    centroid[str(name)] = c.astype(np.float32)
+                    count[str(name)]    = int(n)
+        return centroid, count
+
+    def _load(self):
+        if not os.path.isfile(self.path):
+            return
+        try:
+            self._centroid, self._count = self._read()
+            self._rebuild()
+            print(f"[speakers] {len(self._names)} enrolled profile(s) loaded from {self.path}.")
+        except Exception as e:
+            print(f"[speakers] Could not load {self.path}: {e}")
+
+    def reload(self):
+        """Re-read the store from disk (another server process changed it)."""
+        with self._lock:
+            self._centroid, self._count = {}, {}
+            self._rebuild()
+            self._load()
+
+    def _sync(self):
+        # Other server processes share the file: start every change from what
+        # is on disk, or saving this process's copy would drop theirs.
+        try:
+            self._centroid, self._count = self._read()
+        except Exception as e:
+            print(f"[speakers] Could not re-read {self.path}: {e}")
+
+    def _save(self):
+        names = list(self._centroid)
+        tmp   = f"{self.path}.{os.getpid()}.tmp.npz"   # workers may save concurrently
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        np.savez(
+            tmp,
+            names=np.array(names, dtype=str),
+            centroids=np.stack([self._centroid[n] for n in names]) if names else np.zeros((0, 0), np.float32),
+            counts=np.array([self._count[n] for n in names], dtype=np.int64),
+        )
+        os.replace(tmp, self.path)   # atomic — a crash never leaves a half-written store
+
+    def _rebuild(self):
+        self._names = list(self._centroid)
+        self._ann   = None
+        if not self._names:
+            self._matrix = None
+            return
+        self._matrix = _l2_normalize(
+            np.stack([self._centroid[n] for n in self._names]).astype(np.float32)
+        )
+        if len(self._names) >= SPEAKER_ANN_MIN_PROFILES:
+            try:
+                import hnswlib
+                index = hnswlib.Index(space='cosine', dim=self._matrix.shape[1])
+                index.init_index(max_elements=len(self._names), ef_construction=200, M=16)
+                index.add_items(self._matrix, np.arange(len(self._names)))
+                index.set_ef(64)
+                self._ann = index
+            except ImportError:
+                pass   # exact matrix lookup only
+
+    def __len__(self):
+        return len(self._names)
+
+    def __contains__(self, name):
+        return name in self._centroid
+
+    def lookup(self, embedding):
+        """Return (name, cosine similarity) of the closest profile, or (None, -1.0)."""
+        with self._lock:
+            if self._matrix is None:
+                return None, -1.0
+            q = _l2_normalize(np.asarray(embedding, dtype=np.float32).reshape(1, -1))
+            if self._ann is not None:
+                labels, dists = self._ann.knn_query(q, k=1)
+                idx, score = int(labels[0][0]), 1.0 - float(dists[0][0])
+            else:
+                sims = self._matrix @ q[0]
+                idx  = int(np.argmax(sims))
+                score = float(sims[idx])
+            return self._names[idx], score
+
+    def enroll(self, name, embedding, count=1):
+        """Create or refine the profile `name` with a centroid observed over `count` samples."""
+        embedding = np.asarray(embedding, dtype=np.float32).flatten()
+        with self._lock:
+            self._sync()
+            if name in self._centroid:
+                n = self._count[name]
+                self._centroid[name] = (self._centroid[name] * n + embedding * count) / (n + count)
+                self._count[name]    = n + count
+            else:
+                self._centroid[name] = embedding
+                self._count[name]    = count
+            self._rebuild()
+            self._save()
+
+    def remove(self, name):
+        with self._lock:
+            self._sync()
+            if name not in self._centroid:
+                self._rebuild()
+                return False
+            del self._centroid[name]
+            del self._count[name]
+            self._rebuild()
+            self._save()
+            return True
+
+    def list(self):
+        with self._lock:
+            return [{'name': n, 'samples': self._count[n]} for n in self._names]
+
+_speaker_profiles = _SpeakerProfileStore(SPEAKER_PROFILES_PATH)
+
 # ─── Cross-chunk speaker registry ─────────────────────────────────────────────
 
 _speaker_embeddings = {}   # { global_id: centroid np.ndarray }
@@ -225,29 +695,50 @@ def _cosine_sim(a, b):
     denom = np.linalg.norm(a) * np.linalg.norm(b)
     return float(np.dot(a, b) / denom) if denom > 0 else 0.0
 
-def _match_or_create_speaker(embedding, threshold=None):
+def _match_or_create_speakers(embeddings, threshold=None):
+    """
+    Return the global speaker ID for each embedding, updating the registry.
+
+    Order of resolution: a speaker already seen in this session, then an
+    enrolled profile (the profile name becomes the ID), then a new SPEAKER_n.
+    Similarities of the whole batch against the registry come from a single
+    matrix product; a speaker created mid-batch is added as one extra column.
+    """
     global _speaker_counter
     if threshold is None:
         threshold = DIAR_MATCH_THRESHOLD
-    embedding = np.array(embedding).flatten()
+    embs = np.stack([np.asarray(e, dtype=np.float64).flatten() for e in embeddings])
+    unit = _l2_normalize(embs)
     with _registry_lock:
-        best_id, best_score = None, -1.0
-        for gid, centroid in _speaker_embeddings.items():
-            s = _cosine_sim(embedding, centroid)
-            if s > best_score:
-                best_score, best_id = s, gid
-        if best_score >= threshold and best_id is not None:
-            count = _speaker_counts[best_id]
-            _speaker_embeddings[best_id] = (
-                (_speaker_embeddings[best_id] * count + embedding) / (count + 1)
-            )
-            _speaker_counts[best_id] = count + 1
-            return best_id
-        gid = f"SPEAKER_{_speaker_counter}"
-        _speaker_counter += 1
-        _speaker_embeddings[gid] = embedding
-        _speaker_counts[gid]     = 1
-        return gid
+        ids  = list(_speaker_embeddings)
+        sims = unit @ _l2_normalize(np.stack([_speaker_embeddings[g] for g in ids])).T \
+               if ids else np.zeros((len(embs), 0))
+        result = []
+        for i, embedding in enumerate(embs):
+            if sims.shape[1]:
+                j = int(np.argmax(sims[i]))
+                if sims[i, j] >= threshold:
+                    gid   = ids[j]
+                    count = _speaker_counts[gid]
+                    _speaker_embeddings[gid] = (_speaker_embeddings[gid] * count + embedding) / (count + 1)
+                    _speaker_counts[gid] = count + 1
+                    result.append(gid)
+                    continue
+            name, score = _speaker_profiles.lookup(embedding)
+            if name is not None and score >= SPEAKER_PROFILE_THRESHOLD and name not in _speaker_embeddings:
+                gid = name
+            else:
+                gid = f"SPEAKER_{_speaker_counter}"
+                _speaker_counter += 1
+            _speaker_embeddings[gid] = embedding
+            _speaker_counts[gid]     = 1
+            ids.append(gid)
+            sims = np.hstack([sims, (unit @ unit[i])[:, None]])
+            result.append(gid)
+        return result
+
+def _match_or_create_speaker(embedding, threshold=None):
+    return _match_or_create_speakers([embedding], threshold)[0]
 
 def _merge_similar_speakers(merge_threshold=None):
     """
@@ -280,8 +771,11 @@ def _merge_similar_speakers(merge_threshold=None):
                     sim = _cosine_sim(_speaker_embeddings[a], _speaker_embeddings[b])
                     if sim < merge_threshold:
                         continue
-                    # Keep the speaker with more accumulated samples (more reliable centroid).
-                    if _speaker_counts.get(a, 0) >= _speaker_counts.get(b, 0):
+                    # Keep an enrolled name over an anonymous SPEAKER_n, otherwise the
+                    # speaker with more accumulated samples (more reliable centroid).
+                    if (a in _speaker_profiles) != (b in _speaker_profiles):
+                        keeper, removed = (a, b) if a in _speaker_profiles else (b, a)
+                    elif _speaker_counts.get(a, 0) >= _speaker_counts.get(b, 0):
                         keeper, removed = a, b
                     else:
                         keeper, removed = b, a
@@ -304,14 +798,87 @@ def _merge_similar_speakers(merge_threshold=None):
                     break
     return merge_map
 
+class _SpeakerAliases:
+    """
+    Union-find over speaker IDs for one session (or one offline job).
+
+    Sentences keep the raw ID diarize_chunk gave them; a merge_map from
+    _merge_similar_speakers is folded in with union() in O(α(n)) per pair and
+    labels are resolved with find() only when sentences are serialized — so a
+    merge never rescans the transcript, however long it is.
+    """
+
+    def __init__(self):
+        self._parent = {}
+
+    def find(self, sid):
+        if sid is None:
+            return None
+        parent = self._parent
+        while parent.get(sid, sid) != sid:
+            parent[sid] = parent.get(parent[sid], parent[sid])   # path halving
+            sid = parent[sid]
+        return sid
+
+    def apply(self, merge_map):
+        """Fold a {removed_id: kept_id} map in; the kept ID stays the root."""
+        for removed, kept in merge_map.items():
+            root_r, root_k = self.find(removed), self.find(kept)
+            if root_r != root_k:
+                self._parent[root_r] = root_k
+
+    def resolve(self, sentences):
+        """Copies of `sentences` with their speaker resolved to the current label."""
+        return [
+            dict(s, speaker=self.find(s.get('speaker'))) if s.get('speaker') in self._parent else s
+            for s in sentences
+        ]
+
+# ─── Speaker embeddings ───────────────────────────────────────────────────────
+
+def _fit_length(seg, n):
+    """Centre-crop, or tile, a 1-D segment to exactly n samples."""
+    if len(seg) >= n:
+        start = (len(seg) - n) // 2
+        return seg[start:start + n]
+    return np.resize(seg, n)   # repeats the segment cyclically — no silent padding
+
+def _embed_segments(segments):
+    """
+    Speaker embeddings (N, D) for a list of float32 segments.
+
+    With DIAR_EMB_BATCH_S > 0 all segments are fitted to a common length and
+    run as ONE batched forward pass (per-call overhead dominates on CPU);
+    otherwise — or if the batched call fails — one call per segment.
+    """
+    import torch
+    if DIAR_EMB_BATCH_S > 0:
+        n = int(DIAR_EMB_BATCH_S * SAMPLE_RATE)
+        batch = torch.from_numpy(np.stack([_fit_length(seg, n) for seg in segments])).unsqueeze(1)
+        try:
+            return np.asarray(_embedding_model.infer(batch)).reshape(len(segments), -1)
+        except Exception as e:
+            print(f"[diarization] Batched embedding failed ({e}) — falling back to per-segment.")
+    return np.stack([
+        np.array(_embedding_model({"waveform": torch.from_numpy(seg).unsqueeze(0),
+                                   "sample_rate": SAMPLE_RATE})).flatten()
+        for seg in segments
+    ])
+
 # ─── Audio chunk diarization ──────────────────────────────────────────────────
 
-def diarize_chunk(audio_float32, time_offset, sentences, num_speakers=None):
+def diarize_chunk(audio_float32, time_offset, sentences, num_speakers=None, tracer=None, chunk=None,
+                  cancel=None):
     """Assign a stable global speaker ID to each sentence. Modifies in-place.
 
+    tracer / chunk are only used to label trace spans (see _Tracer).
+    cancel — optional _CancelToken: raises _Cancelled while waiting for the
+    pipeline or once the pipeline returns, so abandoned work skips the rest.
+
     Returns a merge_map dict {removed_id: kept_id} when post-hoc merging
-    collapsed duplicate speakers, so callers can fix already-sent sentences.
-    Returns an empty dict when no merges occurred.
+    collapsed duplicate speakers.  Sentences (including this chunk's) keep the
+    raw IDs; callers fold the map into a _SpeakerAliases table and resolve
+    labels when serializing.  Returns an empty dict when no merges occurred.
     """
     if not _diarization_on:
         for s in sentences:
@@ -327,8 +894,22 @@ def diarize_chunk(audio_float32, time_offset, sentences, num_speakers=None):
             # Pass only as upper bound — forcing min=max causes warnings when
             # a chunk has fewer speakers than expected (e.g. bounds [2,2] with 1 speaker)
             kwargs['max_speakers'] = num_speakers
-        with _pipeline_lock:
+        tracer = tracer or _NULL_TRACER
+        span_args = {'chunk': chunk, 'audio_offset': round(time_offset, 2),
+                     'audio_s': round(len(audio_float32) / SAMPLE_RATE, 2)}
+        cancel = cancel or _CancelToken()
+        t_wait = time.perf_counter()
+        while not _pipeline_lock.acquire(timeout=0.25):
+            cancel.check()   # abandoned while queued behind another diarization
+        try:
+            t_locked = time.perf_counter()
+            tracer.record('pipeline_lock wait', t_wait, t_locked, **span_args)
+            cancel.check()
             result = _diar_pipeline(input_dict, **kwargs)
+            tracer.record('diarization', t_locked, time.perf_counter(), **span_args)
+        finally:
+            _pipeline_lock.release()
+        cancel.check()
         # pyannote 3.x returns DiarizeOutput(speaker_diarization=Annotation, ...)
         # pyannote 2.x returns Annotation directly (has itertracks)
         if hasattr(result, 'itertracks'):
@@ -342,22 +923,28 @@ def diarize_chunk(audio_float32, time_offset, sentences, num_speakers=None):
         else:
             raise ValueError(f"Unexpected diarization output type: {type(result)}")
 
-        # Extract embedding per local speaker → map to global_id
-        local_to_global = {}
+        # First long-enough turn of each local speaker → one embedding each,
+        # extracted in a single batched pass, then matched to global IDs.
+        local_segments = {}
         for turn, _, local_label in diarization.itertracks(yield_label=True):
-            if local_label in local_to_global:
+            if local_label in local_segments:
                 continue
             s_idx = int(turn.start * SAMPLE_RATE)
             e_idx = int(turn.end   * SAMPLE_RATE)
             seg   = audio_float32[s_idx:e_idx]
             if len(seg) < int(DIAR_MIN_SEGMENT_S * SAMPLE_RATE):  # too short for reliable embedding
                 continue
-            seg_t   = torch.from_numpy(seg).unsqueeze(0)
-            emb     = _embedding_model({"waveform": seg_t, "sample_rate": SAMPLE_RATE})
-            emb_arr = np.array(emb).flatten()
-            if not np.isfinite(emb_arr).all():
-                continue  # NaN / Inf embedding from silent/noisy segment — skip
-            local_to_global[local_label] = _match_or_create_speaker(emb_arr)
+            local_segments[local_label] = seg
+        local_to_global = {}
+        if local_segments:
+            labels = list(local_segments)
+            with tracer.span('embedding', speakers=len(labels), **span_args):
+                embs = _embed_segments([local_segments[l] for l in labels])
+            # NaN / Inf embedding from silent/noisy segment — skip
+            valid = [i for i in range(len(labels)) if np.isfinite(embs[i]).all()]
+            if valid:
+                gids = _match_or_create_speakers(embs[valid])
+                local_to_global = {labels[i]: g for i, g in zip(valid, gids)}
 
         # Build turn list once (re-iterating Annotation is fine but cleaner this way)
         all_turns = [
@@ -398,15 +985,14 @@ def diarize_chunk(audio_float32, time_offset, sentences, num_speakers=None):
                     sentences[i]['speaker'] = prev_spk
 
         # Post-hoc merge: collapse any duplicate speakers created by noisy
-        # short-segment embeddings, then apply the merge map to this chunk's sentences.
+        # short-segment embeddings.  The caller's alias table applies it.
         merge_map = _merge_similar_speakers()
         if merge_map:
             print(f"[diarization] Merged speakers: {merge_map}")
-            for s in sentences:
-                if s.get('speaker') in merge_map:
-                    s['speaker'] = merge_map[s['speaker']]
         return merge_map
 
+    except _Cancelled:
+        raise
     except Exception as e:
         import traceback
         print(f"[diarization] Chunk error: {e}")
@@ -433,6 +1019,90 @@ def float_to_int16(audio):
         return (audio * 32767).astype(np.int16)
     return audio.astype(np.int16)
 
+# ─── WebSocket audio transport formats ────────────────────────────────────────
+# Selected by the "format" field of the WS config message:
+#   f32  — little-endian float32 PCM at sampleRate (default, Electron client)
+#   s16  — little-endian int16 PCM at sampleRate (half the bandwidth)
+#   opus / ogg / webm / mp3 / aac / flac — compressed stream, decoded by one
+#          persistent ffmpeg process per session straight to 16 kHz float32
+#          (sampleRate is ignored: the container carries its own rate).
+PCM_FORMATS   = {'f32': '<f4', 'float32': '<f4', 's16': '<i2', 'int16': '<i2'}
+CODEC_DEMUXER = {
+    'opus': 'ogg', 'ogg': 'ogg', 'webm': 'matroska',
+    'mp3':  'mp3', 'aac': 'aac', 'flac': 'flac',
+}
+
+def pcm_to_float32(raw, fmt):
+    """Decode raw little-endian PCM bytes (f32 / s16) to float32 samples."""
+    dtype = np.dtype(PCM_FORMATS[fmt])
+    n     = len(raw) // dtype.itemsize
+    audio = np.frombuffer(raw, dtype=dtype, count=n)
+    if dtype.kind == 'i':
+        return audio.astype(np.float32) / 32768.0
+    return audio.copy()
+
+class _FfmpegStreamDecoder:
+    """
+    Persistent per-session ffmpeg pipe: compressed bytes in, 16 kHz mono
+    float32 out.  A writer thread feeds stdin (so a stalled decoder never
+    blocks the event loop) and a reader thread hands decoded blocks to
+    on_audio(samples) as they become available.
+    """
+
+    def __init__(self, fmt, on_audio):
+        self._on_audio = on_audio
+        self._in_q     = queue.Queue()
+        self._proc     = subprocess.Popen(
+            ['ffmpeg', '-nostdin', '-loglevel', 'error',
+             '-fflags', 'nobuffer', '-probesize', '32', '-analyzeduration', '0',
+             '-f', CODEC_DEMUXER[fmt], '-i', 'pipe:0',
+             '-ar', str(SAMPLE_RATE), '-ac', '1', '-f', 'f32le', 'pipe:1'],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+            bufsize=0,
+        )
+        self._writer = threading.Thread(target=self._write_loop, daemon=True, name='ffmpeg-in')
+        self._reader = threading.Thread(target=self._read_loop, daemon=True, name='ffmpeg-out')
+        self._writer.start()
+        self._reader.start()
+
+    def feed(self, data):
+        self._in_q.put(data)
+
+    def _write_loop(self):
+        try:
+            while True:
+                data = self._in_q.get()
+                if data is None:
+                    break
+                self._proc.stdin.write(data)
+        except (BrokenPipeError, OSError, ValueError):
+            pass
+        finally:
+            try:
+                self._proc.stdin.close()
+            except OSError:
+                pass
+
+    def _read_loop(self):
+        pending = b''
+        while True:
+            block = self._proc.stdout.read(16384)
+            if not block:
+                break
+            pending += block
+            usable = len(pending) - len(pending) % 4
+            if usable:
+                self._on_audio(np.frombuffer(pending[:usable], dtype='<f4').copy())
+                pending = pending[usable:]
+
+    def close(self, timeout=10.0):
+        """Flush: end the input and wait until every decoded sample was delivered."""
+        self._in_q.put(None)
+        self._reader.join(timeout=timeout)
+        if self._proc.poll() is None:
+            self._proc.kill()
+        self._proc.wait()
+
 # ─── Transcription helpers ────────────────────────────────────────────────────
 
 def convert_to_sentence_timestamps(timestamps, tokens):
@@ -453,13 +1123,17 @@ def convert_to_sentence_timestamps(timestamps, tokens):
             buf.append(tok)
     return sentences
 
-def _transcribe(audio_float32, time_offset):
+def _transcribe(audio_float32, time_offset, cancel=None):
+    if cancel is not None:
+        cancel.check()
+    if BACKEND == 'stub':
+        return _transcribe_stub(audio_float32, time_offset)
     return _transcribe_mlx(audio_float32, time_offset) if BACKEND == 'mlx' \
            else _transcribe_onnx(audio_float32, time_offset)
 
 # ── Backend ONNX ──────────────────────────────────────────────────────────────
-def _transcribe_onnx(audio_float32, time_offset):
-    model = get_model()
+def _transcribe_onnx(audio_float32, time_offset, model=None):
+    model = model or get_model()
     out   = model.recognize(float_to_int16(audio_float32))
     if not out.tokens:
         return [], '', 0.0
@@ -490,6 +1164,20 @@ def _transcribe_onnx(audio_float32, time_offset):
     ]
     return sentences, ''.join(out.tokens), last_end
 
+# ── Backend stub (load testing) ───────────────────────────────────────────────
+def _transcribe_stub(audio_float32, time_offset):
+    """One sentence spanning the whole chunk, produced after STUB_ASR_RTF × audio seconds."""
+    audio_s = len(audio_float32) / SAMPLE_RATE
+    _stub_work(audio_s * STUB_ASR_RTF)
+    if audio_s < 0.5 or float(np.abs(audio_float32).max(initial=0.0)) < 1e-4:
+        return [], '', 0.0
+    text = f"Stub sentence at {time_offset:.2f}."
+    return (
+        [{'start': f"{time_offset:.2f}", 'end': f"{time_offset + audio_s:.2f}", 'segment': text}],
+        text,
+        audio_s,
+    )
+
 # ── Backend MLX (Apple Silicon) ───────────────────────────────────────────────
 def _transcribe_mlx(audio_float32, time_offset):
     """
@@ -538,24 +1226,127 @@ def _transcribe_mlx(audio_float32, time_offset):
 
 # ─── Background diarization helper ───────────────────────────────────────────
 
-def _diarize_and_notify(diar_audio, diar_offset, sentences, num_speakers, result_q):
+def _diarize_and_notify(diar_audio, diar_offset, sentences, num_speakers, result_q,
+                        tracer=None, chunk=None, cancel=None):
     """
-    Called from the per-session diarization pool (background thread).
+    Called from the per-session _DiarScheduler (background thread).
     Runs diarization on diar_audio, updates sentence dicts in-place, then
-    pushes a lightweight 'diar_refresh' marker so result_sender re-renders.
-    Because the sentence dicts are shared objects (same refs as in all_sentences
-    on the server side), the in-place update is visible to the next poll.
+    pushes a lightweight 'diar_refresh' marker listing the updated sentences so
+    result_sender can send just their new labels.  Because the sentence dicts
+    are shared objects (same refs as in all_sentences on the server side), the
+    in-place update is visible to the next poll.
     """
     try:
-        merge_map = diarize_chunk(diar_audio, diar_offset, sentences, num_speakers) or {}
-        result_q.put({'diar_refresh': True, 'merge_map': merge_map})
+        merge_map = diarize_chunk(
+            diar_audio, diar_offset, sentences, num_speakers, tracer=tracer, chunk=chunk,
+            cancel=cancel,
+        ) or {}
+        result_q.put({'diar_refresh': True, 'merge_map': merge_map, 'chunk': chunk,
+                      'updated': sentences})
+    except _Cancelled:
+        pass   # session closed — nobody left to send the labels to
     except Exception as e:
         print(f"[diarization] Async error: {e}")
 
+class _DiarScheduler:
+    """
+    Per-session background diarization that coalesces pending work.
+
+    asr_worker submits one window per ASR chunk.  On CPU a single pyannote
+    call can outlast many chunks, so instead of a FIFO of stale 3-5 s windows
+    (each paying the full pipeline overhead) the worker thread takes every
+    window queued since its last run, lays them out on a common timeline and
+    diarizes them as ONE wider window — fewer calls, more speaker context.
+    DIAR_MAX_WINDOW_S caps the merged span so a single call stays bounded;
+    anything beyond it is picked up by the next run.
+    """
+
+    def __init__(self, result_q, tracer=None, cancel=None):
+        self._result_q = result_q
+        self._tracer   = tracer or _NULL_TRACER
+        self._cancel   = cancel   # session token — stops the running window too
+        self._pending  = []   # [(audio, offset, sentences, num_speakers, chunk)]
+        self._cond     = threading.Condition()
+        self._closed   = False
+        self._thread   = threading.Thread(target=self._run, daemon=True, name='diar')
+        self._thread.start()
+
+    def submit(self, audio, offset, sentences, num_speakers=None, chunk=None):
+        with self._cond:
+            if self._closed:
+                return
+            self._pending.append((audio, offset, sentences, num_speakers, chunk))
+            self._cond.notify()
+
+    def shutdown(self, wait=True):
+        """Drop windows not yet started; optionally wait for the running one."""
+        with self._cond:
+            self._closed = True
+            self._pending.clear()
+            self._cond.notify()
+        if wait:
+            self._thread.join()
+
+    def _take(self):
+        with self._cond:
+            while not self._pending and not self._closed:
+                self._cond.wait()
+            if self._closed:
+                return None
+            batch, start = [], self._pending[0][1]
+            while self._pending:
+                audio, offset = self._pending[0][0], self._pending[0][1]
+                span = offset + len(audio) / SAMPLE_RATE - start
+                if batch and span > DIAR_MAX_WINDOW_S:
+                    break
+                batch.append(self._pending.pop(0))
+            return batch
+
+    @staticmethod
+    def _coalesce(batch):
+        """Merge overlapping/adjacent windows into one (audio, offset, sentences, ns, chunk)."""
+        if len(batch) == 1:
+            return batch[0]
+        start = min(job[1] for job in batch)
+        end   = max(job[1] + len(job[0]) / SAMPLE_RATE for job in batch)
+        window = np.zeros(int(round((end - start) * SAMPLE_RATE)), dtype=np.float32)
+        sentences = []
+        for audio, offset, sents, _, _ in batch:
+            i = int(round((offset - start) * SAMPLE_RATE))
+            n = min(len(audio), len(window) - i)
+            window[i:i + n] = audio[:n]
+            sentences.extend(sents)
+        chunk = f"{batch[0][4]}-{batch[-1][4]}"
+        return window, start, sentences, batch[-1][3], chunk
+
+    def _run(self):
+        while True:
+            batch = self._take()
+            if batch is None:
+                return
+            audio, offset, sentences, ns, chunk = self._coalesce(batch)
+            if len(batch) > 1:
+                print(f"[diarization] Coalesced {len(batch)} windows → "
+                      f"{len(audio) / SAMPLE_RATE:.1f} s")
+            _diarize_and_notify(audio, offset, sentences, ns, self._result_q,
+                                tracer=self._tracer, chunk=chunk, cancel=self._cancel)
+
 # ─── Background ASR thread ────────────────────────────────────────────────────
 
-def asr_worker(audio_q, result_q, stop_event, num_speakers_ref=None, diar_pool=None):
+def asr_worker(audio_q, result_q, stop_event, num_speakers_ref=None, diar_sched=None, tracer=None,
+               cancel=None):
+    """
+    Session ASR loop.  audio_q carries (enqueue perf_counter, float32 samples,
+    sample rate) tuples, or None to flush and stop; samples are resampled here,
+    off the event loop.  Queue wait and resampling are traced under the chunk
+    that will transcribe the samples.  Once `cancel` (_CancelToken) is set —
+    the client disconnected — the loop returns at the next chunk boundary
+    without flushing.
+    """
+    cancel = cancel or _CancelToken()
+    tracer = tracer or _NULL_TRACER
     buffer, time_offset = np.array([], dtype=np.float32), 0.0
+    chunk_idx = 0
     # Rolling preroll: keep the last DIAR_CTX_SECONDS of processed audio so
     # each chunk's diarization window overlaps with the previous one.
     # This gives pyannote enough context to correctly identify speakers at
@@ -568,17 +1359,29 @@ def asr_worker(audio_q, result_q, stop_event, num_speakers_ref=None, diar_pool=N
             while True:
                 item = audio_q.get_nowait()
                 if item is None:
-                    _asr_flush(buffer, time_offset, result_q, num_speakers_ref, diar_context)
+                    _asr_flush(buffer, time_offset, result_q, num_speakers_ref, diar_context,
+                               tracer, chunk_idx, cancel)
                     return
-                buffer = np.concatenate([buffer, item])
+                t_put, samples, sr = item
+                chunk  = chunk_idx + 1 + len(buffer) // (CHUNK_SECONDS * SAMPLE_RATE)
+                offset = round(time_offset + len(buffer) / SAMPLE_RATE, 2)
+                tracer.record('audio_q wait', t_put, time.perf_counter(), chunk=chunk, audio_offset=offset)
+                if sr != SAMPLE_RATE:
+                    with tracer.span('resample', chunk=chunk, audio_offset=offset, from_sr=sr):
+                        samples = resample(samples, sr)
+                buffer = np.concatenate([buffer, samples])
         except queue.Empty:
             pass
 
         min_samples = CHUNK_SECONDS * SAMPLE_RATE
         if len(buffer) >= min_samples:
             chunk = buffer[:min_samples]
+            chunk_idx += 1
             try:
-                sents, text, last_end = _transcribe(chunk, time_offset)
+                with tracer.span('_transcribe', chunk=chunk_idx, audio_offset=round(time_offset, 2)):
+                    sents, text, last_end = _transcribe(chunk, time_offset, cancel)
+            except _Cancelled:
+                return
             except Exception as exc:
                 # Transcription error (e.g. Metal GPU crash, bad audio) — log and
                 # skip this chunk rather than killing the asr_worker thread.
@@ -594,10 +1397,10 @@ def asr_worker(audio_q, result_q, stop_event, num_speakers_ref=None, diar_pool=N
             # in-place once the background task completes.
             for s in sents:
                 s['speaker'] = None
-            result_q.put({'sentences': sents, 'text': text, 'merge_map': {}})
+            result_q.put({'sentences': sents, 'text': text, 'merge_map': {}, 'chunk': chunk_idx})
 
-            # ── Submit diarization to per-session pool (non-blocking) ────────
-            if sents and _diarization_on and diar_pool is not None:
+            # ── Submit diarization to per-session scheduler (non-blocking) ───
+            if sents and _diarization_on and diar_sched is not None:
                 if len(diar_context) > 0:
                     # np.concatenate always creates a new array → safe to pass to thread
                     diar_audio  = np.concatenate([diar_context, chunk])
@@ -605,9 +1408,7 @@ def asr_worker(audio_q, result_q, stop_event, num_speakers_ref=None, diar_pool=N
                 else:
                     diar_audio  = chunk.copy()
                     diar_offset = time_offset
-                diar_pool.submit(
-                    _diarize_and_notify, diar_audio, diar_offset, sents, ns, result_q
-                )
+                diar_sched.submit(diar_audio, diar_offset, sents, ns, chunk=chunk_idx)
 
             if sents:
                 carry  = int(last_end * SAMPLE_RATE)
@@ -621,11 +1422,18 @@ def asr_worker(audio_q, result_q, stop_event, num_speakers_ref=None, diar_pool=N
         else:
             time.sleep(0.05)
 
-    _asr_flush(buffer, time_offset, result_q, num_speakers_ref, diar_context)
+    _asr_flush(buffer, time_offset, result_q, num_speakers_ref, diar_context, tracer, chunk_idx, cancel)
 
-def _asr_flush(buffer, time_offset, result_q, num_speakers_ref=None, diar_context=None):
+def _asr_flush(buffer, time_offset, result_q, num_speakers_ref=None, diar_context=None,
+               tracer=None, chunk_idx=0, cancel=None):
+    tracer = tracer or _NULL_TRACER
+    chunk_idx += 1
     if len(buffer) >= SAMPLE_RATE // 2:
-        sents, text, _ = _transcribe(buffer, time_offset)
+        try:
+            with tracer.span('_transcribe', chunk=chunk_idx, audio_offset=round(time_offset, 2), flush=True):
+                sents, text, _ = _transcribe(buffer, time_offset, cancel)
+        except _Cancelled:
+            return   # client disconnected — the tail is not worth transcribing
         ns = num_speakers_ref[0] if num_speakers_ref else None
         merge_map = {}
         if sents:
@@ -637,7 +1445,11 @@ def _asr_flush(buffer, time_offset, result_q, num_speakers_ref=None, diar_contex
                 else:
                     diar_audio  = buffer
                     diar_offset = time_offset
-                merge_map = diarize_chunk(diar_audio, diar_offset, sents, ns) or {}
+                try:
+                    merge_map = diarize_chunk(diar_audio, diar_offset, sents, ns,
+                                              tracer=tracer, chunk=chunk_idx, cancel=cancel) or {}
+                except _Cancelled:
+                    return
             else:
                 # CPU diarization (macOS): skip synchronous call in flush — it
                 # would block the WS stop handler for 30-120 s per chunk.
@@ -646,20 +1458,552 @@ def _asr_flush(buffer, time_offset, result_q, num_speakers_ref=None, diar_contex
                 for s in sents:
                     s.setdefault('speaker', None)
         if sents or text:
-            result_q.put({'sentences': sents, 'text': text, 'final': True, 'merge_map': merge_map})
+            result_q.put({'sentences': sents, 'text': text, 'final': True, 'merge_map': merge_map,
+                          'chunk': chunk_idx})
+
+# ─── Offline transcription pipeline ───────────────────────────────────────────
+# /transcribe-file and /transcribe-full run as three overlapping stages linked
+# by bounded queues (OFFLINE_QUEUE_DEPTH items each):
+#   decode  — ffmpeg streams 16 kHz float32 blocks (OFFLINE_DECODE_THREADS
+#             ffmpeg threads) while ASR is already running on earlier audio;
+#   ASR     — the usual CHUNK_SECONDS loop.  Single worker: each chunk starts
+#             where the previous one's last sentence ended, so chunks cannot
+#             be transcribed out of order;
+#   diarize — OFFLINE_DIAR_WORKERS threads diarize OFFLINE_DIAR_WINDOW_S
+#             windows (plus DIAR_CONTEXT_S preroll) while ASR moves on.
+#             pyannote itself stays serialised by _pipeline_lock; embedding
+#             extraction overlaps.  OFFLINE_DIAR_WINDOW_S=0 diarizes the whole
+#             recording in one pass once ASR is done (previous behaviour).
+OFFLINE_QUEUE_DEPTH    = int(os.environ.get('OFFLINE_QUEUE_DEPTH',    '8'))
+OFFLINE_DECODE_THREADS = int(os.environ.get('OFFLINE_DECODE_THREADS', '2'))
+OFFLINE_DIAR_WORKERS   = int(os.environ.get('OFFLINE_DIAR_WORKERS',   '1'))
+OFFLINE_DIAR_WINDOW_S  = float(os.environ.get('OFFLINE_DIAR_WINDOW_S', '120'))
+OFFLINE_BLOCK_S        = 1.0   # decode granularity
+
+def _reset_speaker_registry():
+    global _speaker_embeddings, _speaker_counts, _speaker_counter
+    with _registry_lock:
+        _speaker_embeddings = {}
+        _speaker_counts     = {}
+        _speaker_counter    = 0
+
+def _ffmpeg_blocks(file_path):
+    """Decode any ffmpeg-readable file, yielding 16 kHz mono float32 blocks as they come."""
+    # stderr goes to a file, not a pipe: a damaged input can log more than a
+    # pipe buffer holds (~4 KB on Windows) and ffmpeg would block writing it.
+    with tempfile.TemporaryFile() as err:
+        proc = subprocess.Popen(
+            ['ffmpeg', '-nostdin', '-loglevel', 'error', '-threads', str(OFFLINE_DECODE_THREADS),
+             '-i', file_path, '-ar', str(SAMPLE_RATE), '-ac', '1', '-f', 'f32le', 'pipe:1'],
+            stdout=subprocess.PIPE, stderr=err,
+        )
+        block_bytes = int(OFFLINE_BLOCK_S * SAMPLE_RATE) * 4
+        try:
+            while True:
+                data = proc.stdout.read(block_bytes)
+                if not data:
+                    break
+                yield np.frombuffer(data[:len(data) - len(data) % 4], dtype='<f4').copy()
+            if proc.wait() != 0:
+                err.seek(max(0, err.seek(0, os.SEEK_END) - 4096))
+                raise subprocess.CalledProcessError(proc.returncode, 'ffmpeg', stderr=err.read())
+        finally:
+            if proc.poll() is None:
+                proc.kill()
+                proc.wait()
+            proc.stdout.close()
+
+def _array_blocks(audio):
+    step = int(OFFLINE_BLOCK_S * SAMPLE_RATE)
+    for i in range(0, len(audio), step):
+        yield audio[i:i + step]
+
+def _offline_transcribe(blocks, diarize=False, cancel=None):
+    """
+    Run decode → ASR → diarization as a staged pipeline (see above).
+
+    blocks  — iterable of float32 blocks at SAMPLE_RATE (_ffmpeg_blocks / _array_blocks)
+    diarize — assign speakers; otherwise every sentence gets speaker None.
+    cancel  — optional _CancelToken; once set every stage stops at its next
+              block / chunk / window and _Cancelled is raised.
+    Returns (sentences, full_text) with speaker merges already resolved.
+    """
+    _reset_speaker_registry()
+    # One flag stops every stage: set by the caller's token or by a failing stage.
+    abort   = cancel if cancel is not None else _CancelToken()
+    errors  = []
+    audio_q = queue.Queue(maxsize=OFFLINE_QUEUE_DEPTH)
+    diar_q  = queue.Queue(maxsize=OFFLINE_QUEUE_DEPTH)
+    aliases = _SpeakerAliases()
+    aliases_lock = threading.Lock()
+
+    def put(q, item):
+        while not abort.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def get(q):
+        """Next item, or None on end-of-stream / abort."""
+        while not abort.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        return None
+
+    def decode_stage():
+        try:
+            for block in blocks:
+                if not put(audio_q, block):
+                    return
+        except Exception as e:
+            errors.append(e)
+            abort.set()
+        finally:
+            if hasattr(blocks, 'close'):
+                blocks.close()   # stops ffmpeg early when the pipeline aborted
+            put(audio_q, None)
+
+    def diar_stage():
+        while True:
+            item = get(diar_q)
+            if item is None:
+                return
+            w_audio, w_offset, w_sents = item
+            try:
+                merge_map = diarize_chunk(w_audio, w_offset, w_sents, cancel=abort)
+            except _Cancelled:
+                return
+            if merge_map:
+                with aliases_lock:
+                    aliases.apply(merge_map)
+
+    threads = [threading.Thread(target=decode_stage, daemon=True, name='offline-decode')]
+    if diarize:
+        threads += [
+            threading.Thread(target=diar_stage, daemon=True, name=f'offline-diar-{i}')
+            for i in range(max(1, OFFLINE_DIAR_WORKERS))
+        ]
+    for t in threads:
+        t.start()
+
+    # Diarization window being filled by the ASR stage
+    window_samples = int(OFFLINE_DIAR_WINDOW_S * SAMPLE_RATE) if OFFLINE_DIAR_WINDOW_S > 0 else None
+    ctx_samples    = int(DIAR_CONTEXT_S * SAMPLE_RATE)
+    win_audio, win_sents, win_len = [], [], 0
+    win_start, consumed = 0, 0                  # in samples
+    context = np.array([], dtype=np.float32)
+
+    def emit_window():
+        nonlocal win_audio, win_sents, win_len, win_start, context
+        if win_sents:
+            audio = np.concatenate([context] + win_audio)
+            put(diar_q, (audio, (win_start - len(context)) / SAMPLE_RATE, win_sents))
+            context = audio[-ctx_samples:] if ctx_samples else context
+        elif win_audio:
+            context = np.concatenate([context] + win_audio)[-ctx_samples:] if ctx_samples else context
+        win_audio, win_sents, win_len, win_start = [], [], 0, consumed
+
+    def consume(audio, sents):
+        """Hand audio the ASR stage is done with (and its sentences) to diarization."""
+        nonlocal win_len, consumed
+        consumed += len(audio)
+        if not diarize:
+            return
+        win_audio.append(audio)
+        win_sents.extend(sents)
+        win_len += len(audio)
+        if window_samples is not None and win_len >= window_samples:
+            emit_window()
+
+    all_sentences = []
+    full_text     = ''
+    chunk_size    = CHUNK_SECONDS * SAMPLE_RATE
+    time_offset   = 0.0
+    buffer        = np.array([], dtype=np.float32)
+    eof           = False
+    try:
+        while True:
+            while not eof and len(buffer) < chunk_size:
+                block = get(audio_q)
+                if block is None:
+                    eof = True
+                else:
+                    buffer = np.concatenate([buffer, block])
+            if abort.is_set() or len(buffer) < chunk_size:
+                break
+            chunk = buffer[:chunk_size]
+            sents, text, last_end = _transcribe(chunk, time_offset, abort)
+            if sents:
+                all_sentences.extend(sents)
+            if text:
+                full_text += (' ' if full_text else '') + text
+            if sents:
+                carry  = int(last_end * SAMPLE_RATE)
+                consume(chunk[:carry], sents)
+                buffer = buffer[carry:]
+                time_offset += last_end
+            else:
+                consume(chunk, [])
+                buffer = buffer[chunk_size:]
+                time_offset += CHUNK_SECONDS
 
-# ─── Pool helpers ─────────────────────────────────────────────────────────────
+        # Flush remaining audio
+        if not abort.is_set():
+            sents = []
+            if len(buffer) >= SAMPLE_RATE // 2:
+                sents, text, _ = _transcribe(buffer, time_offset)
+                if sents:
+                    all_sentences.extend(sents)
+                if text:
+                    full_text += (' ' if full_text else '') + text
+            consume(buffer, sents)
+            if diarize:
+                emit_window()
+    except BaseException:
+        abort.set()
+        raise
+    finally:
+        for _ in threads[1:]:
+            put(diar_q, None)
+        for t in threads:
+            t.join()
+    if errors:
+        raise errors[0]
+    abort.check()
+
+    if diarize:
+        all_sentences = aliases.resolve(all_sentences)
+    for s in all_sentences:
+        s.setdefault('speaker', None)
+    return all_sentences, full_text
+
+# ─── Admission control for HTTP transcription ─────────────────────────────────
+# /transcribe-full and /transcribe-file share one ASR model and _pipeline_lock,
+# so running many at once only makes every one of them slower.  Jobs run on a
+# dedicated pool of TRANSCRIBE_MAX_CONCURRENT threads; up to
+# TRANSCRIBE_MAX_QUEUE more wait (at most TRANSCRIBE_QUEUE_TIMEOUT_S seconds)
+# and anything beyond is refused immediately with 429 + Retry-After, estimated
+# from the audio seconds ahead in line and the observed real-time factor.
+TRANSCRIBE_MAX_CONCURRENT  = int(os.environ.get('TRANSCRIBE_MAX_CONCURRENT',  '1'))
+TRANSCRIBE_MAX_QUEUE       = int(os.environ.get('TRANSCRIBE_MAX_QUEUE',       '4'))
+TRANSCRIBE_QUEUE_TIMEOUT_S = float(os.environ.get('TRANSCRIBE_QUEUE_TIMEOUT_S', '120'))
+
+class _Overloaded(Exception):
+    def __init__(self, status, retry_after, reason):
+        super().__init__(reason)
+        self.status, self.retry_after, self.reason = status, retry_after, reason
+
+class _AdmissionController:
+    """
+    Bounded concurrency + bounded FIFO wait queue for transcription jobs.
 
-def _shutdown_pool(pool, wait=True):
-    """Shut down a ThreadPoolExecutor, cancelling queued (not-yet-started) tasks.
+    Only touched from the event loop (no lock needed); the jobs themselves run
+    on self.executor.
+    """
 
-    Python 3.9+ supports cancel_futures=True natively.  On older versions we
-    fall back to shutdown(wait=wait) which drains the queue normally.
+    def __init__(self, max_concurrent, max_queue, timeout_s):
+        self.max_concurrent   = max(1, max_concurrent)
+        self.max_queue        = max(0, max_queue)
+        self.timeout_s        = timeout_s
+        self.executor         = _cf.ThreadPoolExecutor(self.max_concurrent, thread_name_prefix='transcribe')
+        self._running         = 0
+        self._running_audio_s = 0.0
+        self._waiters         = collections.deque()   # [future, audio_s]
+        self._queued_audio_s  = 0.0
+        self._rtf             = 0.3    # processing s per audio s — EMA of finished jobs
+        self.rejected         = 0
+        self.timed_out        = 0
+
+    def retry_after(self, extra_audio_s=0.0):
+        """Seconds until the work ahead (plus extra_audio_s) should be done."""
+        backlog = self._running_audio_s + self._queued_audio_s + extra_audio_s
+        return max(1, math.ceil(backlog * self._rtf / self.max_concurrent))
+
+    def _admit(self, audio_s):
+        self._running += 1
+        self._running_audio_s += audio_s
+
+    async def acquire(self, audio_s):
+        if self._running < self.max_concurrent and not self._waiters:
+            self._admit(audio_s)
+            return
+        if len(self._waiters) >= self.max_queue:
+            self.rejected += 1
+            raise _Overloaded(429, self.retry_after(), 'Too many transcriptions queued')
+        fut   = asyncio.get_running_loop().create_future()
+        entry = [fut, audio_s]
+        self._waiters.append(entry)
+        self._queued_audio_s += audio_s
+        try:
+            await asyncio.wait_for(fut, self.timeout_s)
+        except asyncio.TimeoutError:
+            if fut.done() and not fut.cancelled():
+                return   # admitted at the very last moment
+            self.timed_out += 1
+            raise _Overloaded(503, self.retry_after(), 'Timed out waiting for a transcription slot')
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                self.release(audio_s)   # admitted, but the request went away
+            raise
+        finally:
+            if entry in self._waiters:
+                self._waiters.remove(entry)
+                self._queued_audio_s -= audio_s
+
+    def release(self, audio_s, elapsed_s=None):
+        self._running -= 1
+        self._running_audio_s -= audio_s
+        if elapsed_s is not None and audio_s > 0:
+            self._rtf = 0.7 * self._rtf + 0.3 * (elapsed_s / audio_s)
+        while self._waiters and self._running < self.max_concurrent:
+            fut, queued_s = self._waiters.popleft()
+            self._queued_audio_s -= queued_s
+            if not fut.done():
+                self._admit(queued_s)
+                fut.set_result(None)
+
+    async def run(self, fn, audio_s):
+        """
+        Wait for a slot (or raise _Overloaded), then run fn() on the pool.
+
+        Cancelling the calling task while queued just leaves the queue; once
+        running, the slot stays taken until fn() really returns (cancellable
+        jobs return at their next chunk boundary, see _run_transcription).
+        """
+        await self.acquire(audio_s)
+        t0  = time.monotonic()
+        job = asyncio.get_running_loop().run_in_executor(self.executor, fn)
+        try:
+            return await asyncio.shield(job)
+        except asyncio.CancelledError:
+            try:
+                await job
+            except BaseException:
+                pass
+            raise
+        finally:
+            self.release(audio_s, time.monotonic() - t0)
+
+    def stats(self):
+        return {
+            'running':        self._running,
+            'queued':         len(self._waiters),
+            'queued_audio_s': round(self._queued_audio_s, 1),
+            'max_concurrent': self.max_concurrent,
+            'max_queue':      self.max_queue,
+            'rtf':            round(self._rtf, 3),
+            'rejected':       self.rejected,
+            'timed_out':      self.timed_out,
+        }
+
+_admission = _AdmissionController(
+    TRANSCRIBE_MAX_CONCURRENT, TRANSCRIBE_MAX_QUEUE, TRANSCRIBE_QUEUE_TIMEOUT_S
+)
+
+def _overloaded_response(e):
+    return JSONResponse(
+        {'error': e.reason, 'retry_after': e.retry_after},
+        status_code=e.status,
+        headers={'Retry-After': str(e.retry_after)},
+    )
+
+DISCONNECT_POLL_S = 0.5
+
+async def _run_transcription(request, fn, audio_s):
+    """
+    _admission.run(fn(cancel), audio_s), abandoned when the HTTP client goes
+    away (e.g. the app aborts a re-transcription): the _CancelToken handed to
+    fn is set, a queued request leaves the queue and a running one stops at
+    its next chunk boundary, freeing its slot for other work.
+    Returns fn's result, or raises _Cancelled.
     """
+    cancel = _CancelToken()
+    job    = asyncio.ensure_future(_admission.run(lambda: fn(cancel), audio_s))
+    while True:
+        done, _ = await asyncio.wait({job}, timeout=DISCONNECT_POLL_S)
+        if done:
+            return job.result()
+        if await request.is_disconnected():
+            cancel.set()
+            job.cancel()
+            try:
+                await job
+            except (asyncio.CancelledError, _Cancelled):
+                pass
+            raise _Cancelled()
+
+def _cancelled_response():
+    # 499 "client closed request" — only visible in logs, nobody is listening.
+    return JSONResponse({'error': 'Client disconnected'}, status_code=499)
+
+def _probe_duration(file_path):
+    """Media duration in seconds via ffprobe (0.0 when unknown)."""
     try:
-        pool.shutdown(wait=wait, cancel_futures=True)
-    except TypeError:
-        pool.shutdown(wait=wait)
+        out = subprocess.run(
+            ['ffprobe', '-v', 'error', '-show_entries', 'format=duration',
+             '-of', 'default=noprint_wrappers=1:nokey=1', file_path],
+            check=True, capture_output=True, text=True, timeout=10,
+        )
+        return float(out.stdout.strip())
+    except (subprocess.SubprocessError, OSError, ValueError):
+        return 0.0
+
+# ─── Result cache for /transcribe-file ────────────────────────────────────────
+# Re-importing the same media file returns the stored transcript instead of
+# decoding and transcribing it again.  Entries are JSON files named
+# <content hash>-<config hash>.json in RESULT_CACHE_DIR:
+#   content hash — BLAKE2b of the file bytes, memoised per (path, size, mtime)
+#                  so an unchanged file is not re-read;
+#   config hash  — everything that changes the output: backend, ASR model and
+#                  precision, CHUNK_SECONDS, DIAR_* and offline window settings.
+# The directory is the source of truth (workers of a multi-process server
+# share it); hits refresh an entry's mtime and the oldest entries are evicted
+# once the total exceeds RESULT_CACHE_MAX_MB.  RESULT_CACHE_DIR='' disables it.
+RESULT_CACHE_DIR    = os.environ.get(
+    'RESULT_CACHE_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache', 'transcripts'),
+)
+RESULT_CACHE_MAX_MB = float(os.environ.get('RESULT_CACHE_MAX_MB', '200'))
+RESULT_CACHE_VERSION = 1   # bump when the pipeline's output format or logic changes
+
+class _ResultCache:
+    """On-disk LRU of transcription results keyed by file content + config."""
+
+    _FINGERPRINTS_MAX = 1024
+
+    def __init__(self, directory, max_bytes):
+        self.directory    = directory
+        self.max_bytes    = max_bytes
+        self._lock        = threading.Lock()
+        self._fingerprint = collections.OrderedDict()   # (path, size, mtime_ns) → content hash
+        self.hits = self.misses = self.evictions = 0
+
+    @property
+    def enabled(self):
+        return bool(self.directory) and self.max_bytes > 0
+
+    @staticmethod
+    def _config_hash():
+        config = {
+            'version':   RESULT_CACHE_VERSION,
+            'backend':   BACKEND,
+            'model':     ASR_MODEL_NAME if BACKEND == 'onnx' else BACKEND,
+            'precision': _asr_precision,
+            'chunk_s':   CHUNK_SECONDS,
+            'diar':      [DIAR_MATCH_THRESHOLD, DIAR_MERGE_THRESHOLD, DIAR_MIN_SEGMENT_S,
+                          DIAR_CONTEXT_S, DIAR_EMB_BATCH_S, OFFLINE_DIAR_WINDOW_S],
+        }
+        return hashlib.blake2b(json.dumps(config, sort_keys=True).encode(), digest_size=8).hexdigest()
+
+    def content_hash(self, file_path):
+        """Hash of the file bytes; skipped when path, size and mtime are unchanged."""
+        st  = os.stat(file_path)
+        fp  = (os.path.realpath(file_path), st.st_size, st.st_mtime_ns)
+        with self._lock:
+            if fp in self._fingerprint:
+                self._fingerprint.move_to_end(fp)
+                return self._fingerprint[fp]
+        h = hashlib.blake2b(digest_size=16)
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                h.update(block)
+        digest = h.hexdigest()
+        with self._lock:
+            self._fingerprint[fp] = digest
+            while len(self._fingerprint) > self._FINGERPRINTS_MAX:
+                self._fingerprint.popitem(last=False)
+        return digest
+
+    def key_for(self, file_path):
+        return f"{self.content_hash(file_path)}-{self._config_hash()}"
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.json')
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, encoding='utf-8') as f:
+                result = json.load(f)
+            os.utime(path)   # LRU: eviction removes the least recently used first
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return result
+
+    def put(self, key, result):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(key)
+        tmp  = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False)
+        os.replace(tmp, path)
+        self._evict()
+
+    def _entries(self):
+        """[(mtime, size, path)] of every cached result, oldest first."""
+        try:
+            entries = [(e.stat().st_mtime, e.stat().st_size, e.path)
+                       for e in os.scandir(self.directory) if e.name.endswith('.json')]
+        except OSError:
+            return []
+        return sorted(entries)
+
+    def _evict(self):
+        entries = self._entries()
+        total   = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+                with self._lock:
+                    self.evictions += 1
+            except OSError:
+                pass
+
+    def invalidate(self, file_path=None):
+        """Remove every entry for file_path's content (all entries when None)."""
+        prefix  = self.content_hash(file_path) + '-' if file_path else ''
+        removed = 0
+        for _, _, path in self._entries():
+            if os.path.basename(path).startswith(prefix):
+                try:
+                    os.remove(path)
+                    removed += 1
+                except OSError:
+                    pass
+        return removed
+
+    def stats(self, with_size=True):
+        """Counters of this process; with_size also scans the directory."""
+        lookups = self.hits + self.misses
+        stats   = {
+            'enabled':   self.enabled,
+            'hits':      self.hits,
+            'misses':    self.misses,
+            'hit_rate':  round(self.hits / lookups, 3) if lookups else None,
+            'evictions': self.evictions,
+        }
+        if with_size:
+            entries = self._entries() if self.enabled else []
+            stats.update({
+                'entries': len(entries),
+                'size_mb': round(sum(size for _, size, _ in entries) / 2**20, 2),
+                'max_mb':  round(self.max_bytes / 2**20, 2),
+            })
+        return stats
+
+_result_cache = _ResultCache(RESULT_CACHE_DIR, RESULT_CACHE_MAX_MB * 2**20)
 
 # ─── FastAPI app ──────────────────────────────────────────────────────────────
 
@@ -667,7 +2011,13 @@ app = FastAPI()
 
 @app.get("/health")
 async def health():
-    return JSONResponse({"status": "ok", "model_ready": _model_ready})
+    return JSONResponse({
+        "status":        "ok",
+        "model_ready":   _model_ready,
+        "asr_precision": _asr_precision if BACKEND == 'onnx' else BACKEND,
+        "transcription": _admission.stats(),
+        "result_cache":  _result_cache.stats(with_size=False),
+    })
 
 @app.get("/shutdown")
 async def shutdown():
@@ -678,6 +2028,84 @@ async def shutdown():
     threading.Thread(target=_exit, daemon=True).start()
     return JSONResponse({"status": "shutting down"})
 
+@app.get("/trace/{session_id}")
+async def get_trace(session_id: str):
+    """Chrome trace-event JSON of a recent traced WS session (chrome://tracing, Perfetto)."""
+    with _traces_lock:
+        tracer = _traces.get(session_id)
+    if tracer is not None:
+        return JSONResponse(tracer.to_chrome())
+    path = _trace_path(session_id)
+    if path is None:
+        return JSONResponse({'error': 'Unknown session'}, status_code=404)
+    return FileResponse(path, media_type='application/json')
+
+@app.get("/speakers")
+async def list_speakers():
+    """List enrolled speaker profiles."""
+    return JSONResponse({'speakers': _speaker_profiles.list()})
+
+@app.post("/speakers/enroll")
+async def enroll_speaker(request: Request):
+    """
+    Enroll (or refine) a named voice profile.  JSON body:
+      {"name": "Alice", "speaker": "SPEAKER_0"}  — use the centroid accumulated
+          for that ID during the current/last session (behind the dispatcher,
+          add the session's "worker" index), or
+      {"name": "Alice", "path": "/abs/path/sample.wav"} — embed a clean sample
+          of Alice speaking alone (any format ffmpeg can decode).
+    """
+    data = await request.json()
+    name = (data.get('name') or '').strip()
+    if not name:
+        return JSONResponse({'error': 'Missing name'}, status_code=400)
+
+    if data.get('speaker'):
+        with _registry_lock:
+            centroid = _speaker_embeddings.get(data['speaker'])
+            count    = _speaker_counts.get(data['speaker'], 1)
+        if centroid is None:
+            return JSONResponse({'error': 'Unknown speaker'}, status_code=404)
+        await asyncio.get_event_loop().run_in_executor(
+            None, _speaker_profiles.enroll, name, centroid, count)
+        return JSONResponse({'status': 'enrolled', 'name': name, 'samples': count})
+
+    file_path = data.get('path', '')
+    if not file_path or not os.path.isfile(file_path):
+        return JSONResponse({'error': 'File not found'}, status_code=400)
+    if not _diarization_on:
+        return JSONResponse({'error': 'Diarization disabled'}, status_code=503)
+
+    def _embed():
+        import torch
+        out = subprocess.run(
+            ['ffmpeg', '-nostdin', '-i', file_path,
+             '-ar', str(SAMPLE_RATE), '-ac', '1', '-f', 'f32le', '-'],
+            check=True, capture_output=True,
+        )
+        audio = np.frombuffer(out.stdout, dtype='<f4').copy()
+        emb = _embedding_model({"waveform": torch.from_numpy(audio).unsqueeze(0),
+                                "sample_rate": SAMPLE_RATE})
+        return np.array(emb).flatten()
+
+    emb = await asyncio.get_event_loop().run_in_executor(None, _embed)
+    if not np.isfinite(emb).all():
+        return JSONResponse({'error': 'Sample too short or silent'}, status_code=400)
+    await asyncio.get_event_loop().run_in_executor(None, _speaker_profiles.enroll, name, emb)
+    return JSONResponse({'status': 'enrolled', 'name': name, 'samples': 1})
+
+@app.post("/speakers/reload")
+async def reload_speakers():
+    """Re-read the profile store — sent by the dispatcher after another worker changed it."""
+    await asyncio.get_event_loop().run_in_executor(None, _speaker_profiles.reload)
+    return JSONResponse({'status': 'reloaded', 'speakers': len(_speaker_profiles)})
+
+@app.delete("/speakers/{name}")
+async def delete_speaker(name: str):
+    if not await asyncio.get_event_loop().run_in_executor(None, _speaker_profiles.remove, name):
+        return JSONResponse({'error': 'Unknown speaker'}, status_code=404)
+    return JSONResponse({'status': 'removed', 'name': name})
+
 @app.post("/transcribe-file")
 async def transcribe_file_endpoint(request: Request):
     """
@@ -690,64 +2118,54 @@ async def transcribe_file_endpoint(request: Request):
     if not file_path or not os.path.isfile(file_path):
         return JSONResponse({'error': 'File not found'}, status_code=400)
 
-    def _run():
-        import soundfile as sf
-        fd, tmp_path = tempfile.mkstemp(suffix='.wav')
-        os.close(fd)
+    loop      = asyncio.get_event_loop()
+    cache_key = None
+    if _result_cache.enabled:
         try:
-            subprocess.run(
-                ['ffmpeg', '-y', '-i', file_path,
-                 '-ar', str(SAMPLE_RATE), '-ac', '1', '-f', 'wav', tmp_path],
-                check=True, capture_output=True,
-            )
-            audio, _ = sf.read(tmp_path, dtype='float32')
-        finally:
-            try:
-                os.unlink(tmp_path)
-            except OSError:
-                pass
-
-        global _speaker_embeddings, _speaker_counts, _speaker_counter
-        with _registry_lock:
-            _speaker_embeddings = {}
-            _speaker_counts     = {}
-            _speaker_counter    = 0
-
-        all_sentences = []
-        full_text     = ''
-        chunk_size    = CHUNK_SECONDS * SAMPLE_RATE
-        time_offset   = 0.0
-        buffer        = audio.copy()
-
-        while len(buffer) >= chunk_size:
-            chunk = buffer[:chunk_size]
-            sents, text, last_end = _transcribe(chunk, time_offset)
-            if sents:
-                all_sentences.extend(sents)
-            if text:
-                full_text += (' ' if full_text else '') + text
-            if sents:
-                carry  = int(last_end * SAMPLE_RATE)
-                buffer = np.concatenate([chunk[carry:], buffer[chunk_size:]])
-                time_offset += last_end
-            else:
-                buffer = buffer[chunk_size:]
-                time_offset += CHUNK_SECONDS
-
-        if len(buffer) >= SAMPLE_RATE // 2:
-            sents, text, _ = _transcribe(buffer, time_offset)
-            if sents:
-                all_sentences.extend(sents)
-            if text:
-                full_text += (' ' if full_text else '') + text
-
-        for s in all_sentences:
-            s.setdefault('speaker', None)
-
-        return all_sentences, full_text
-
-    all_sents, full_text = await asyncio.get_event_loop().run_in_executor(None, _run)
-    return JSONResponse({'sentences': all_sents, 'fullText': full_text})
+            cache_key = await loop.run_in_executor(None, _result_cache.key_for, file_path)
+        except OSError as e:
+            print(f"[cache] Could not hash {file_path}: {e}")
+        cached = await loop.run_in_executor(None, _result_cache.get, cache_key) if cache_key else None
+        if cached is not None:
+            # Served without decoding or admission — nothing to wait for.
+            return JSONResponse(cached, headers={'X-Cache': 'hit'})
+
+    def _run(cancel):
+        # Decoding streams straight into ASR — no temp WAV, no full-file wait.
+        return _offline_transcribe(_ffmpeg_blocks(file_path), cancel=cancel)
+
+    audio_s = await loop.run_in_executor(None, _probe_duration, file_path)
+    try:
+        all_sents, full_text = await _run_transcription(request, _run, audio_s)
+    except _Overloaded as e:
+        return _overloaded_response(e)
+    except _Cancelled:
+        return _cancelled_response()
+    result = {'sentences': all_sents, 'fullText': full_text}
+    if cache_key:
+        try:
+            await loop.run_in_executor(None, _result_cache.put, cache_key, result)
+        except OSError as e:
+            print(f"[cache] Could not store result: {e}")
+    return JSONResponse(result, headers={'X-Cache': 'miss'} if cache_key else None)
+
+@app.get("/cache")
+async def cache_stats():
+    """Hit / miss statistics and size of the /transcribe-file result cache."""
+    return JSONResponse(_result_cache.stats())
+
+@app.delete("/cache")
+async def invalidate_cache(path: str = ''):
+    """
+    Drop cached results: those of one media file with ?path=/abs/path/file,
+    or the whole cache without a path.
+    """
+    if path and not os.path.isfile(path):
+        return JSONResponse({'error': 'File not found'}, status_code=400)
+    removed = await asyncio.get_event_loop().run_in_executor(
+        None, _result_cache.invalidate, path or None
+    )
+    return JSONResponse({'status': 'invalidated', 'removed': removed})
 
 
 @app.post("/transcribe-full")
@@ -762,59 +2180,21 @@ async def transcribe_full(request: Request):
 
     audio = np.frombuffer(body, dtype='<f4').copy()
 
-    # Reset speaker registry for a clean transcription
-    global _speaker_embeddings, _speaker_counts, _speaker_counter
-    with _registry_lock:
-        _speaker_embeddings = {}
-        _speaker_counts     = {}
-        _speaker_counter    = 0
-
-    def _run():
-        all_sentences = []
-        full_text     = ''
-        chunk_size    = CHUNK_SECONDS * SAMPLE_RATE
-        time_offset   = 0.0
-        buffer        = audio.copy()
-
-        # ── Phase 1 : transcription only (fast — MLX/GPU) ───────────────────
-        while len(buffer) >= chunk_size:
-            chunk = buffer[:chunk_size]
-            sents, text, last_end = _transcribe(chunk, time_offset)
-            if sents:
-                all_sentences.extend(sents)
-            if text:
-                full_text += (' ' if full_text else '') + text
-            if sents:
-                carry  = int(last_end * SAMPLE_RATE)
-                buffer = np.concatenate([chunk[carry:], buffer[chunk_size:]])
-                time_offset += last_end
-            else:
-                buffer = buffer[chunk_size:]
-                time_offset += CHUNK_SECONDS
-
-        # Flush remaining audio
-        if len(buffer) >= SAMPLE_RATE // 2:
-            sents, text, _ = _transcribe(buffer, time_offset)
-            if sents:
-                all_sentences.extend(sents)
-            if text:
-                full_text += (' ' if full_text else '') + text
-
-        # ── Phase 2 : single-pass diarization on the full audio ─────────────
-        # Running pyannote once on the whole recording is both faster and more
-        # accurate than calling it for every chunk (no cold-start, full context).
+    def _run(cancel):
+        # Diarization overlaps ASR window by window (see _offline_transcribe).
         # On macOS (CPU), skip diarization here — it would time out the HTTP
         # request on long recordings.  The client can run /transcribe-full
         # without speaker labels on macOS, which is fast enough to be usable.
-        if all_sentences and _diarization_on and _diar_on_gpu:
-            diarize_chunk(audio, 0.0, all_sentences)
-        else:
-            for s in all_sentences:
-                s.setdefault('speaker', None)
-
-        return all_sentences, full_text
+        return _offline_transcribe(
+            _array_blocks(audio), diarize=_diarization_on and _diar_on_gpu, cancel=cancel
+        )
 
-    all_sents, full_text = await asyncio.get_event_loop().run_in_executor(None, _run)
+    try:
+        all_sents, full_text = await _run_transcription(request, _run, len(audio) / SAMPLE_RATE)
+    except _Overloaded as e:
+        return _overloaded_response(e)
+    except _Cancelled:
+        return _cancelled_response()
     return JSONResponse({'sentences': all_sents, 'fullText': full_text})
 
 
@@ -822,26 +2202,28 @@ async def transcribe_full(request: Request):
 async def ws_transcribe(websocket: WebSocket):
     await websocket.accept()
 
-    global _speaker_embeddings, _speaker_counts, _speaker_counter
-    with _registry_lock:
-        _speaker_embeddings = {}
-        _speaker_counts     = {}
-        _speaker_counter    = 0
+    _reset_speaker_registry()
 
     audio_q          = queue.Queue()
     asr_rq           = queue.Queue()
     stop_evt         = threading.Event()
     num_speakers_ref = [None]  # mutable — updated when config arrives
-
-    # Per-session pool (max_workers=1) — created fresh for every WS session so
-    # there is no backlog from previous sessions competing with /transcribe-full.
-    # Shut down in the stop handler (cancels pending tasks, waits for the running
-    # one to finish) so /transcribe-full always gets exclusive pipeline access.
-    diar_pool = _cf.ThreadPoolExecutor(max_workers=1, thread_name_prefix='diar')
+    # Enabled up front by TRACE_SESSIONS, or later by {"trace": true} in config.
+    tracer           = _Tracer(uuid.uuid4().hex[:12], enabled=TRACE_SESSIONS)
+    # Set when the client disconnects: ASR and diarization stop at the next
+    # chunk boundary instead of finishing work nobody will receive.
+    session_cancel   = _CancelToken()
+
+    # Per-session diarization scheduler (one worker thread) — created fresh for
+    # every WS session so there is no backlog from previous sessions competing
+    # with /transcribe-full.  Shut down in the stop handler (drops pending
+    # windows, waits for the running one to finish) so /transcribe-full always
+    # gets exclusive pipeline access.
+    diar_sched = _DiarScheduler(asr_rq, tracer, session_cancel)
 
     asr_thread = threading.Thread(
         target=asr_worker,
-        args=(audio_q, asr_rq, stop_evt, num_speakers_ref, diar_pool),
+        args=(audio_q, asr_rq, stop_evt, num_speakers_ref, diar_sched, tracer, session_cancel),
         daemon=True,
     )
     asr_thread.start()
@@ -849,50 +2231,90 @@ async def ws_transcribe(websocket: WebSocket):
     # Accumulators for the client
     all_sentences = []
     full_text     = ''
+    aliases       = _SpeakerAliases()   # retroactive speaker merges, resolved on send
+    sent_pos      = {}                  # { id(sentence dict): index in all_sentences }
+
+    def absorb(results):
+        """
+        Fold queued ASR/diarization results into the session state.
+
+        Returns (transcript_changed, remap, updated):
+          transcript_changed — new sentences or text were appended
+          remap   — {old_id: current_id} for speakers merged in this batch
+          updated — sentence dicts whose speaker was (re)assigned by diarization
+        """
+        nonlocal full_text
+        changed, merged, updated = False, [], []
+        for r in results:
+            merge_map = r.get('merge_map')
+            if merge_map:
+                aliases.apply(merge_map)
+                merged.extend(merge_map)
+            if r.get('diar_refresh'):
+                # Background diarization completed — sentence dicts were
+                # updated in-place; only their labels need to reach the client.
+                updated.extend(r.get('updated', []))
+                continue
+            for sent in r.get('sentences', []):
+                sent_pos[id(sent)] = len(all_sentences)
+                all_sentences.append(sent)
+            t = r.get('text', '')
+            if t:
+                full_text += (' ' if full_text else '') + t
+            changed = changed or bool(r.get('sentences')) or bool(t)
+        return changed, {old: aliases.find(old) for old in merged}, updated
+
+    def transcript_payload(final=False):
+        payload = {
+            'type':      'transcript',
+            'sentences': aliases.resolve(all_sentences),
+            'fullText':  full_text,
+        }
+        if final:
+            payload['final'] = True
+        return payload
 
     async def result_sender():
-        nonlocal all_sentences, full_text
         while True:
             await asyncio.sleep(0.1)
             results = []
             while not asr_rq.empty():
                 results.append(asr_rq.get_nowait())
+            if not results:
+                continue
 
-            if results:
-                for r in results:
-                    # Apply speaker merges retroactively: if two SPEAKER_ IDs were
-                    # collapsed into one (same person detected twice), fix all
-                    # sentences already sent, not just the new ones.
-                    merge_map = r.get('merge_map', {})
-                    if merge_map:
-                        for s in all_sentences:
-                            if s.get('speaker') in merge_map:
-                                s['speaker'] = merge_map[s['speaker']]
-                    if r.get('diar_refresh'):
-                        # Background diarization completed — sentence dicts were
-                        # updated in-place, merge_map applied above.  No new
-                        # sentences or text to add; just fall through to re-render.
-                        pass
-                    else:
-                        all_sentences.extend(r.get('sentences', []))
-                        t = r.get('text', '')
-                        if t:
-                            full_text += (' ' if full_text else '') + t
-                payload = {
-                    'type':      'transcript',
-                    'sentences': all_sentences,
-                    'fullText':  full_text,
-                }
-                try:
-                    await websocket.send_text(json.dumps(payload))
-                except Exception as send_err:
-                    # Client disconnected or WS closed — stop sending silently.
-                    print(f"[result_sender] WebSocket send failed: {send_err}")
-                    return
+            changed, remap, updated = absorb(results)
+            messages = []
+            if remap:
+                # Speakers merged retroactively (same person detected twice):
+                # a compact label remap instead of resending the transcript.
+                messages.append({'type': 'speaker_remap', 'map': remap})
+            if changed:
+                messages.append(transcript_payload())
+            elif updated:
+                messages.append({
+                    'type':    'speaker_update',
+                    'updates': [[sent_pos[id(u)], aliases.find(u.get('speaker'))]
+                                for u in updated if id(u) in sent_pos],
+                })
+            span_args = {'chunk': results[-1].get('chunk'), 'sentences': len(all_sentences)}
+            try:
+                for payload in messages:
+                    with tracer.span('result_sender serialize', type=payload['type'], **span_args):
+                        text = json.dumps(payload)
+                    with tracer.span('result_sender send', type=payload['type'], **span_args):
+                        await websocket.send_text(text)
+            except Exception as send_err:
+                # Client disconnected or WS closed — stop sending silently.
+                print(f"[result_sender] WebSocket send failed: {send_err}")
+                return
 
     sender_task = asyncio.create_task(result_sender())
 
-    sample_rate = SAMPLE_RATE  # default
+    sample_rate  = SAMPLE_RATE  # default
+    audio_fmt    = 'f32'        # see PCM_FORMATS / CODEC_DEMUXER
+    decoder      = None         # _FfmpegStreamDecoder for compressed formats
+    trace_dumped = False
 
     try:
         while True:
@@ -902,14 +2324,48 @@ async def ws_transcribe(websocket: WebSocket):
                 data = json.loads(msg['text'])
                 if data.get('type') == 'config':
                     sample_rate = int(data.get('sampleRate', SAMPLE_RATE))
+                    fmt = str(data.get('format', audio_fmt)).lower()
+                    if fmt not in PCM_FORMATS and fmt not in CODEC_DEMUXER:
+                        await websocket.send_text(json.dumps(
+                            {'type': 'error', 'message': f'Unsupported audio format: {fmt}'}
+                        ))
+                    elif fmt != audio_fmt:
+                        new_decoder = None
+                        if fmt in CODEC_DEMUXER:
+                            try:
+                                new_decoder = _FfmpegStreamDecoder(
+                                    fmt, lambda a: audio_q.put((time.perf_counter(), a, SAMPLE_RATE))
+                                )
+                            except OSError as exc:
+                                # ffmpeg missing / not executable: keep the previous format
+                                await websocket.send_text(json.dumps(
+                                    {'type': 'error', 'message': f'Cannot decode {fmt}: ffmpeg failed to start ({exc})'}
+                                ))
+                        if new_decoder is not None or fmt not in CODEC_DEMUXER:
+                            if decoder is not None:
+                                # Previous codec: flush what it decoded, stop its ffmpeg
+                                await asyncio.get_event_loop().run_in_executor(None, decoder.close)
+                            audio_fmt, decoder = fmt, new_decoder
                     ns = data.get('numSpeakers')
                     if ns is not None:
                         nsv = int(ns)
                         # 2 is the UI default and means "auto-detect".
                         # Only constrain pyannote when the user explicitly chose > 2.
                         num_speakers_ref[0] = nsv if nsv > 2 else None
+                    if data.get('trace') and not tracer.enabled:
+                        tracer.enabled = True
+                    if tracer.enabled:
+                        _keep_trace(tracer)
+                    if tracer.enabled or SERVER_WORKER_INDEX is not None:
+                        session = {'type': 'session', 'id': tracer.session_id, 'trace': tracer.enabled}
+                        if SERVER_WORKER_INDEX is not None:
+                            session['worker'] = int(SERVER_WORKER_INDEX)
+                        await websocket.send_text(json.dumps(session))
                 elif data.get('type') == 'stop':
-                    # End signal: flush and wait for the thread
+                    # End signal: drain the decoder, flush and wait for the thread
+                    if decoder is not None:
+                        await asyncio.get_event_loop().run_in_executor(None, decoder.close)
+                        decoder = None
                     audio_q.put(None)
                     stop_evt.set()
                     await asyncio.get_event_loop().run_in_executor(
@@ -921,50 +2377,49 @@ async def ws_transcribe(websocket: WebSocket):
                     # On CPU (macOS): don't wait — CPU diarization can take
                     # 30-120 s per chunk and would block the stop flow.
                     await asyncio.get_event_loop().run_in_executor(
-                        None, lambda: _shutdown_pool(diar_pool, wait=_diar_on_gpu)
+                        None, lambda: diar_sched.shutdown(wait=_diar_on_gpu)
                     )
-                    # Send any remaining final result
+                    # Send any remaining final result (labels resolved through aliases)
+                    remaining = []
                     while not asr_rq.empty():
-                        r = asr_rq.get_nowait()
-                        merge_map = r.get('merge_map', {})
-                        if merge_map:
-                            for s in all_sentences:
-                                if s.get('speaker') in merge_map:
-                                    s['speaker'] = merge_map[s['speaker']]
-                        if not r.get('diar_refresh'):
-                            all_sentences.extend(r.get('sentences', []))
-                            t = r.get('text', '')
-                            if t:
-                                full_text += (' ' if full_text else '') + t
-                    payload = {
-                        'type':      'transcript',
-                        'sentences': all_sentences,
-                        'fullText':  full_text,
-                        'final':     True,
-                    }
-                    await websocket.send_text(json.dumps(payload))
+                        remaining.append(asr_rq.get_nowait())
+                    absorb(remaining)
+                    await websocket.send_text(json.dumps(transcript_payload(final=True)))
+                    if tracer.enabled and TRACE_DIR and not trace_dumped:
+                        trace_dumped = True
+                        print(f"[trace] Written to {tracer.dump(TRACE_DIR)}")
 
             elif 'bytes' in msg:
                 raw = msg['bytes']
-                # Float32Array (little-endian)
-                n_samples = len(raw) // 4
-                if n_samples > 0:
-                    audio = np.frombuffer(raw, dtype='<f4').copy()
-                    if sample_rate != SAMPLE_RATE:
-                        audio = resample(audio, sample_rate)
-                    audio_q.put(audio)
+                if audio_fmt in CODEC_DEMUXER:
+                    # Compressed frame — decoded (and resampled) by ffmpeg
+                    if decoder is not None:
+                        decoder.feed(raw)
+                    continue
+                audio = pcm_to_float32(raw, audio_fmt)
+                if len(audio) > 0:
+                    audio_q.put((time.perf_counter(), audio, sample_rate))
 
     except (WebSocketDisconnect, RuntimeError):
         pass
     finally:
         sender_task.cancel()
+        session_cancel.set()
+        if decoder is not None:
+            decoder.close(timeout=0)
         stop_evt.set()
         audio_q.put(None)
-        # Best-effort cleanup: cancel queued diarization tasks without waiting.
-        _shutdown_pool(diar_pool, wait=False)
+        # Best-effort cleanup: drop queued diarization windows without waiting.
+        diar_sched.shutdown(wait=False)
+        if tracer.enabled and TRACE_DIR:
+            if not trace_dumped:
+                print(f"[trace] Written to {tracer.dump(TRACE_DIR)}")
+            # Served from the file from now on — don't hold the events in memory.
+            with _traces_lock:
+                _traces.pop(tracer.session_id, None)
 
 # ─── Entry point ──────────────────────────────────────────────────────────────
 
 if __name__ == '__main__':
     import uvicorn
-    uvicorn.run(app, host='127.0.0.1', port=8765, log_level='info')
+    uvicorn.run(app, host=SERVER_HOST, port=SERVER_PORT, log_level='info')
@@ -0,0 +1,99 @@
+"""
+bench_embeddings.py — speaker-embedding throughput, per-segment vs batched.
+
+Cuts speaker-length segments (1–6 s, the range diarize_chunk sees) out of an
+audio file — or out of synthetic noise when no file is given — and extracts
+their embeddings two ways:
+
+  * per-segment — one forward pass per segment at its natural length
+                  (DIAR_EMB_BATCH_S=0, the behaviour before batching)
+  * batched     — segments fitted to DIAR_EMB_BATCH_S and run in groups of
+                  --batch, as diarize_chunk does for a window's local speakers
+
+and reports embeddings/sec for both, plus the mean cosine similarity between
+the two embeddings of each segment (how much the crop/tile changes them).
+
+Requires HF_TOKEN (pyannote/embedding is a gated model).
+
+Usage:
+    python tools/bench_embeddings.py [audio_file] [--segments 64] [--batch 4 8 16]
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np  # noqa: E402
+import server       # noqa: E402
+
+
+def load_audio(path):
+    """Decode any ffmpeg-readable file to mono float32 at server.SAMPLE_RATE."""
+    out = subprocess.run(
+        ['ffmpeg', '-nostdin', '-i', path, '-ar', str(server.SAMPLE_RATE),
+         '-ac', '1', '-f', 'f32le', '-'],
+        check=True, capture_output=True,
+    )
+    return np.frombuffer(out.stdout, dtype='<f4').copy()
+
+
+def make_segments(audio, count, rng):
+    sr   = server.SAMPLE_RATE
+    segs = []
+    for _ in range(count):
+        n     = int(rng.uniform(1.0, 6.0) * sr)
+        start = int(rng.integers(0, max(1, len(audio) - n)))
+        segs.append(np.ascontiguousarray(audio[start:start + n], dtype=np.float32))
+    return segs
+
+
+def run(segments, batch_s, batch):
+    server.DIAR_EMB_BATCH_S = batch_s
+    t0   = time.perf_counter()
+    embs = [server._embed_segments(segments[i:i + batch]) for i in range(0, len(segments), batch)]
+    return np.concatenate(embs), time.perf_counter() - t0
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument('audio', nargs='?', help='audio file to cut segments from (default: synthetic noise)')
+    ap.add_argument('--segments', type=int, default=64, help='segments per measurement (default 64)')
+    ap.add_argument('--batch', type=int, nargs='+', default=[4, 8, 16], help='batch sizes to measure')
+    ap.add_argument('--timeout', type=float, default=600, help='seconds to wait for the ASR and pyannote models')
+    args = ap.parse_args()
+
+    # Importing server also preloads the ASR model on the same cores; wait
+    # for it too, or its loading (or INT8 quantization) skews the timings.
+    t0 = time.time()
+    while not (server._diarization_on and server._model_ready):
+        if time.time() - t0 > args.timeout:
+            sys.exit("ASR model not loaded" if server._diarization_on
+                     else "Diarization models not loaded (is HF_TOKEN set?)")
+        time.sleep(0.5)
+
+    rng = np.random.default_rng(0)
+    if args.audio:
+        audio = load_audio(args.audio)
+    else:
+        audio = (rng.standard_normal(120 * server.SAMPLE_RATE) * 0.1).astype(np.float32)
+    segments = make_segments(audio, args.segments, rng)
+    batch_s  = server.DIAR_EMB_BATCH_S if server.DIAR_EMB_BATCH_S > 0 else 3.0
+
+    run(segments[:2], 0, 1)         # warm-up: allocator, kernels
+    run(segments[:2], batch_s, 2)
+
+    ref, t_ref = run(segments, 0, 1)
+    print(f"{'mode':24s} {'emb/s':>8s} {'speedup':>8s} {'cos vs per-seg':>15s}")
+    print(f"{'per-segment':24s} {len(segments) / t_ref:8.1f} {'1.00x':>8s} {'—':>15s}")
+    for b in args.batch:
+        embs, t = run(segments, batch_s, b)
+        cos = np.sum(server._l2_normalize(ref) * server._l2_normalize(embs), axis=1)
+        print(f"{f'batched {b} × {batch_s:g} s':24s} {len(segments) / t:8.1f} "
+              f"{t_ref / t:7.2f}x {np.nanmean(cos):15.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,163 @@
+"""
+eval_asr_precision.py — compare the fp32 and INT8 Parakeet ONNX models.
+
+Runs every audio file of a local folder through both precisions with the same
+chunking as the server (CHUNK_SECONDS windows, carry-over at the last sentence
+end) and reports, per file and overall:
+
+  * RTF   — real-time factor (processing seconds / audio seconds, lower is faster)
+  * agree — word-level agreement of the INT8 transcript with the fp32 one
+            (1 - word error rate, fp32 used as reference)
+
+Usage:
+    python tools/eval_asr_precision.py path/to/audio_dir [--json report.json]
+
+Any format ffmpeg can decode is accepted (wav, mp3, m4a, mp4, ogg…).
+"""
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+
+# Load the server module without diarization and with the fp32 model as the
+# process-wide default: the INT8 model is loaded explicitly below.
+os.environ['PARAKEET_BACKEND'] = 'onnx'
+os.environ['HF_TOKEN']         = ''
+os.environ['ASR_PRECISION']    = 'fp32'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np  # noqa: E402
+import server       # noqa: E402
+
+AUDIO_EXTS = ('.wav', '.mp3', '.m4a', '.mp4', '.ogg', '.opus', '.flac', '.webm', '.aac')
+
+
+def load_audio(path):
+    """Decode any ffmpeg-readable file to mono float32 at server.SAMPLE_RATE."""
+    out = subprocess.run(
+        ['ffmpeg', '-nostdin', '-i', path, '-ar', str(server.SAMPLE_RATE),
+         '-ac', '1', '-f', 'f32le', '-'],
+        check=True, capture_output=True,
+    )
+    return np.frombuffer(out.stdout, dtype='<f4').copy()
+
+
+def transcribe(model, audio):
+    """Chunked transcription identical to the server's offline loop."""
+    chunk_size  = server.CHUNK_SECONDS * server.SAMPLE_RATE
+    time_offset = 0.0
+    buffer      = audio
+    texts       = []
+    while len(buffer) >= chunk_size:
+        chunk = buffer[:chunk_size]
+        sents, text, last_end = server._transcribe_onnx(chunk, time_offset, model)
+        if text:
+            texts.append(text)
+        if sents:
+            carry  = int(last_end * server.SAMPLE_RATE)
+            buffer = np.concatenate([chunk[carry:], buffer[chunk_size:]])
+            time_offset += last_end
+        else:
+            buffer = buffer[chunk_size:]
+            time_offset += server.CHUNK_SECONDS
+    if len(buffer) >= server.SAMPLE_RATE // 2:
+        _, text, _ = server._transcribe_onnx(buffer, time_offset, model)
+        if text:
+            texts.append(text)
+    return ' '.join(texts)
+
+
+def words(text):
+    return re.findall(r"\w+(?:'\w+)?", text.lower())
+
+
+def edit_distance(ref, hyp):
+    """Word-level Levenshtein distance (substitutions + insertions + deletions)."""
+    prev = list(range(len(hyp) + 1))
+    for i, r in enumerate(ref, 1):
+        cur = [i] + [0] * len(hyp)
+        for j, h in enumerate(hyp, 1):
+            cur[j] = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (r != h))
+        prev = cur
+    return prev[-1]
+
+
+def timed(model, audio):
+    t0   = time.perf_counter()
+    text = transcribe(model, audio)
+    return text, time.perf_counter() - t0
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument('audio_dir', help='folder containing the evaluation audio files')
+    ap.add_argument('--json', dest='json_path', help='also write the full report to this file')
+    args = ap.parse_args()
+
+    files = sorted(
+        os.path.join(args.audio_dir, f) for f in os.listdir(args.audio_dir)
+        if f.lower().endswith(AUDIO_EXTS)
+    )
+    if not files:
+        sys.exit(f"No audio files found in {args.audio_dir}")
+
+    models = {
+        'fp32': server.get_model(),
+        'int8': server._load_asr_model('int8'),
+    }
+    warmup = np.zeros(server.CHUNK_SECONDS * server.SAMPLE_RATE, dtype=np.float32)
+    for m in models.values():
+        m.recognize(server.float_to_int16(warmup))
+
+    rows = []
+    tot  = {'audio_s': 0.0, 'fp32_s': 0.0, 'int8_s': 0.0, 'ref_words': 0, 'edits': 0}
+    print(f"{'file':40s} {'audio s':>8s} {'RTF fp32':>9s} {'RTF int8':>9s} {'speedup':>8s} {'agree':>7s}")
+    for path in files:
+        audio     = load_audio(path)
+        audio_s   = len(audio) / server.SAMPLE_RATE
+        if audio_s == 0:
+            continue
+        ref, t_ref = timed(models['fp32'], audio)
+        hyp, t_hyp = timed(models['int8'], audio)
+        ref_w, hyp_w = words(ref), words(hyp)
+        edits = edit_distance(ref_w, hyp_w)
+        agree = 1.0 - edits / len(ref_w) if ref_w else float(not hyp_w)
+        row = {
+            'file': os.path.basename(path), 'audio_s': round(audio_s, 2),
+            'rtf_fp32': round(t_ref / audio_s, 4), 'rtf_int8': round(t_hyp / audio_s, 4),
+            'speedup': round(t_ref / t_hyp, 2) if t_hyp > 0 else None,
+            'word_agreement': round(agree, 4),
+        }
+        rows.append(row)
+        tot['audio_s'] += audio_s
+        tot['fp32_s']  += t_ref
+        tot['int8_s']  += t_hyp
+        tot['ref_words'] += len(ref_w)
+        tot['edits']     += edits
+        print(f"{row['file'][:40]:40s} {audio_s:8.1f} {row['rtf_fp32']:9.3f} {row['rtf_int8']:9.3f} "
+              f"{row['speedup'] or 0:7.2f}x {agree:7.1%}")
+
+    summary = {
+        'files':          len(rows),
+        'audio_s':        round(tot['audio_s'], 2),
+        'rtf_fp32':       round(tot['fp32_s'] / tot['audio_s'], 4),
+        'rtf_int8':       round(tot['int8_s'] / tot['audio_s'], 4),
+        'speedup':        round(tot['fp32_s'] / tot['int8_s'], 2) if tot['int8_s'] > 0 else None,
+        'word_agreement': round(1.0 - tot['edits'] / tot['ref_words'], 4) if tot['ref_words'] else None,
+        'providers':      server.providers,
+    }
+    print('-' * 86)
+    print(f"{'TOTAL':40s} {summary['audio_s']:8.1f} {summary['rtf_fp32']:9.3f} {summary['rtf_int8']:9.3f} "
+          f"{summary['speedup'] or 0:7.2f}x {summary['word_agreement'] or 0:7.1%}")
+
+    if args.json_path:
+        with open(args.json_path, 'w', encoding='utf-8') as f:
+            json.dump({'summary': summary, 'files': rows}, f, indent=2)
+        print(f"Report written to {args.json_path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,334 @@
+"""
+loadtest_ws.py — how many live /ws/transcribe sessions can one server sustain?
+
+Opens N concurrent WebSocket sessions that behave like the Electron client:
+a `config` message, float32 16 kHz frames of 4096 samples paced in real time,
+then `stop` and a wait for the final transcript.  N ramps through the values
+given with --ramp; for each step the report shows:
+
+  * latency p50/p90/p99 — wall time from the moment the audio at a sentence's
+                          end was sent to the moment that sentence arrived
+  * lag / drift         — audio sent minus audio transcribed, at the end of the
+                          stream and its slope (seconds per minute); a positive
+                          drift means the server falls further behind over time
+  * final               — p50 time from `stop` to the final transcript
+  * dropped             — sessions that failed to connect, were closed early or
+                          never received their final transcript
+  * CPU / RSS           — server process usage (needs --spawn or --server-pid;
+                          psutil when installed, /proc otherwise)
+
+Audio comes from the given files (cycled across sessions, any format ffmpeg
+decodes) or is synthesised: two alternating voices of tone bursts, so the
+stub diarization sees two speakers.
+
+--spawn stub starts server.py with PARAKEET_BACKEND=stub: no models, ASR and
+diarization replaced by stand-ins costing STUB_ASR_RTF / STUB_DIAR_RTF seconds
+per audio second — this measures the serving path itself.  --spawn real
+starts the normal server; without --spawn an already running server is used.
+
+Usage:
+    python tools/loadtest_ws.py --spawn stub --ramp 1 4 16 32 --duration 60
+    python tools/loadtest_ws.py --audio meeting.wav --ramp 1 2 4 --server-pid 1234
+"""
+import argparse
+import asyncio
+import bisect
+import json
+import os
+import subprocess
+import sys
+import time
+import urllib.request
+
+import numpy as np
+
+try:
+    import websockets
+except ImportError:
+    sys.exit("The 'websockets' package is required (installed with uvicorn[standard]).")
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+SAMPLE_RATE = 16000
+FRAME       = 4096     # samples per message — BUFFER_SIZE of the Electron client
+SERVER_PY   = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'server.py')
+
+
+# ─── Audio ────────────────────────────────────────────────────────────────────
+
+def load_audio(path):
+    """Decode any ffmpeg-readable file to mono float32 at 16 kHz."""
+    out = subprocess.run(
+        ['ffmpeg', '-nostdin', '-i', path, '-ar', str(SAMPLE_RATE),
+         '-ac', '1', '-f', 'f32le', '-'],
+        check=True, capture_output=True,
+    )
+    return np.frombuffer(out.stdout, dtype='<f4').copy()
+
+
+def synthetic_audio(seconds, seed=0):
+    """Two alternating 'voices' (harmonic tone bursts at 130 / 210 Hz) in 4 s turns."""
+    rng = np.random.default_rng(seed)
+    t   = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    f0  = np.where((t // 4.0) % 2 == 0, 130.0, 210.0)
+    voice = sum(np.sin(2 * np.pi * f0 * k * t) / k for k in (1, 2, 3, 4))
+    syllables = np.clip(np.sin(2 * np.pi * 4.0 * t), 0, None)   # ~4 syllables / s
+    pause     = (t % 4.0) < 3.5                                  # 0.5 s gap per turn
+    audio = 0.1 * voice * syllables * pause + 0.005 * rng.standard_normal(len(t))
+    return audio.astype(np.float32)
+
+
+def fit_length(audio, seconds):
+    n = int(seconds * SAMPLE_RATE)
+    return np.resize(audio, n) if len(audio) < n else audio[:n]
+
+
+# ─── Server process ───────────────────────────────────────────────────────────
+
+def spawn_server(mode, url):
+    env = dict(os.environ)
+    if mode == 'stub':
+        env['PARAKEET_BACKEND'] = 'stub'
+    proc = subprocess.Popen([sys.executable, SERVER_PY], env=env)
+    health = url.replace('ws://', 'http://').split('/ws/')[0] + '/health'
+    deadline = time.time() + 900
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            sys.exit(f"server.py exited with code {proc.returncode}")
+        try:
+            with urllib.request.urlopen(health, timeout=2) as r:
+                if json.load(r).get('model_ready'):
+                    return proc
+        except OSError:
+            pass
+        time.sleep(1)
+    proc.terminate()
+    sys.exit("Server did not become ready in time.")
+
+
+class ProcessMonitor:
+    """
+    Samples CPU% and RSS of a process and its children (the workers when the
+    server runs with SERVER_WORKERS > 1) in the background.
+    """
+
+    def __init__(self, pid, interval=0.5):
+        self.pid, self.interval = pid, interval
+        self.samples = []   # (cpu_percent, rss_bytes)
+        self._task   = None
+
+    def _usage_psutil(self):
+        """{pid: (cpu_seconds, rss_bytes)} for the process tree."""
+        root  = psutil.Process(self.pid)
+        usage = {}
+        for p in [root] + root.children(recursive=True):
+            try:
+                cpu = p.cpu_times()
+                usage[p.pid] = (cpu.user + cpu.system, p.memory_info().rss)
+            except psutil.NoSuchProcess:
+                pass
+        return usage
+
+    def _usage_proc(self):
+        stats = {}
+        for name in os.listdir('/proc'):
+            if name.isdigit():
+                try:
+                    with open(f'/proc/{name}/stat') as f:
+                        stats[int(name)] = f.read().rsplit(')', 1)[1].split()
+                except OSError:
+                    pass
+        tree = {self.pid}
+        for _ in range(3):   # dispatcher → worker → helper processes
+            tree |= {pid for pid, fields in stats.items() if int(fields[1]) in tree}
+        tick, page = os.sysconf('SC_CLK_TCK'), os.sysconf('SC_PAGE_SIZE')
+        return {pid: ((int(stats[pid][11]) + int(stats[pid][12])) / tick, int(stats[pid][21]) * page)
+                for pid in tree if pid in stats}
+
+    async def _run(self):
+        if psutil is not None:
+            read = self._usage_psutil
+        elif os.path.exists(f'/proc/{self.pid}'):
+            read = self._usage_proc
+        else:
+            return
+        last, last_t = read(), time.perf_counter()
+        while True:
+            await asyncio.sleep(self.interval)
+            usage = read()
+            now   = time.perf_counter()
+            # Per-PID deltas: processes that exited or restarted never count negative.
+            cpu = sum(max(0.0, c - last.get(pid, (0.0, 0))[0]) for pid, (c, _) in usage.items())
+            self.samples.append((100.0 * cpu / (now - last_t), sum(r for _, r in usage.values())))
+            last, last_t = usage, now
+
+    def start(self):
+        self.samples = []
+        if self.pid:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except (asyncio.CancelledError, Exception):
+                pass
+        if not self.samples:
+            return None
+        cpu = [c for c, _ in self.samples]
+        return {'cpu_mean': float(np.mean(cpu)), 'cpu_max': float(np.max(cpu)),
+                'rss_max_mb': max(r for _, r in self.samples) / 2**20}
+
+
+# ─── One client session ───────────────────────────────────────────────────────
+
+async def run_session(idx, audio, args):
+    """Stream `audio` like the Electron client; return per-session measurements."""
+    res = {'latencies': [], 'lags': [], 'final_s': None, 'dropped': True, 'error': None}
+    sent_end, sent_wall = [], []      # audio seconds sent so far → wall time of that frame
+    await asyncio.sleep(idx * args.stagger)
+
+    async def receive(ws, start, stop_at):
+        seen = 0
+        async for message in ws:
+            data = json.loads(message)
+            if data.get('type') != 'transcript':
+                continue
+            now   = time.perf_counter()
+            sents = data.get('sentences', [])
+            if data.get('final'):
+                res['final_s'] = now - stop_at[0]
+                return True
+            for s in sents[seen:]:
+                i = bisect.bisect_left(sent_end, float(s['end']))
+                if i < len(sent_wall):
+                    res['latencies'].append(now - sent_wall[i])
+            seen = len(sents)
+            if sents and sent_end:
+                res['lags'].append((now - start, sent_end[-1] - float(sents[-1]['end'])))
+        return False
+
+    try:
+        async with websockets.connect(args.url, max_size=None, open_timeout=30) as ws:
+            await ws.send(json.dumps({'type': 'config', 'sampleRate': SAMPLE_RATE,
+                                      'numSpeakers': args.num_speakers}))
+            start   = time.perf_counter()
+            stop_at = [None]
+            receiver = asyncio.create_task(receive(ws, start, stop_at))
+            for i in range(0, len(audio), FRAME):
+                frame = audio[i:i + FRAME]
+                delay = start + (i + len(frame)) / SAMPLE_RATE - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)   # real-time pacing, like a microphone
+                if receiver.done():
+                    break                        # server closed the connection
+                await ws.send(frame.astype('<f4').tobytes())
+                sent_end.append((i + len(frame)) / SAMPLE_RATE)
+                sent_wall.append(time.perf_counter())
+            stop_at[0] = time.perf_counter()
+            await ws.send(json.dumps({'type': 'stop'}))
+            res['dropped'] = not await asyncio.wait_for(receiver, args.final_timeout)
+    except Exception as e:
+        res['error'] = f"{type(e).__name__}: {e}"
+    return res
+
+
+def drift_per_minute(lags):
+    if len(lags) < 2:
+        return None
+    t, lag = np.array(lags).T
+    return float(np.polyfit(t, lag, 1)[0] * 60) if np.ptp(t) > 0 else None
+
+
+def pct(values, q):
+    return float(np.percentile(values, q)) if values else None
+
+
+async def run_step(n, audios, args, monitor):
+    monitor.start()
+    results = await asyncio.gather(*(run_session(i, audios[i % len(audios)], args) for i in range(n)))
+    usage   = await monitor.stop()
+    ok      = [r for r in results if not r['dropped']]
+    lat     = [l for r in ok for l in r['latencies']]
+    drifts  = [d for d in (drift_per_minute(r['lags']) for r in ok) if d is not None]
+    errors  = sorted({r['error'] for r in results if r['error']})
+    return {
+        'sessions':       n,
+        'dropped':        n - len(ok),
+        'latency_p50':    pct(lat, 50),
+        'latency_p90':    pct(lat, 90),
+        'latency_p99':    pct(lat, 99),
+        'lag_end':        pct([r['lags'][-1][1] for r in ok if r['lags']], 50),
+        'drift_s_per_min': float(np.median(drifts)) if drifts else None,
+        'final_p50':      pct([r['final_s'] for r in ok if r['final_s'] is not None], 50),
+        'server':         usage,
+        'errors':         errors,
+    }
+
+
+def fmt(v, spec='6.2f'):
+    return format(v, spec) if v is not None else format('—', '>' + spec.split('.')[0])
+
+
+def print_row(row):
+    u = row['server'] or {}
+    print(f"{row['sessions']:8d} {row['dropped']:7d} {fmt(row['latency_p50'])} {fmt(row['latency_p90'])} "
+          f"{fmt(row['latency_p99'])} {fmt(row['lag_end'], '7.2f')} {fmt(row['drift_s_per_min'], '7.2f')} "
+          f"{fmt(row['final_p50'])} {fmt(u.get('cpu_mean'), '7.0f')} {fmt(u.get('cpu_max'), '7.0f')} "
+          f"{fmt(u.get('rss_max_mb'), '7.0f')}")
+    for e in row['errors']:
+        print(f"{'':17s}! {e}")
+
+
+async def main_async(args, audios, server_pid):
+    monitor = ProcessMonitor(server_pid)
+    rows = []
+    print(f"{'sessions':>8s} {'dropped':>7s} {'p50 s':>6s} {'p90 s':>6s} {'p99 s':>6s} "
+          f"{'lag s':>7s} {'drift':>7s} {'final':>6s} {'cpu%':>7s} {'cpu% ^':>7s} {'RSS MB':>7s}")
+    for n in args.ramp:
+        row = await run_step(n, audios, args, monitor)
+        rows.append(row)
+        print_row(row)
+        await asyncio.sleep(args.cooldown)
+    return rows
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument('--audio', nargs='*', default=[], help='audio files (default: synthetic audio)')
+    ap.add_argument('--ramp', type=int, nargs='+', default=[1, 2, 4, 8], help='concurrent sessions per step')
+    ap.add_argument('--duration', type=float, default=60, help='seconds of audio streamed per session')
+    ap.add_argument('--url', default='ws://127.0.0.1:8765/ws/transcribe')
+    ap.add_argument('--spawn', choices=['stub', 'real'], help='start server.py for the run')
+    ap.add_argument('--server-pid', type=int, help='PID of a running server to monitor')
+    ap.add_argument('--num-speakers', type=int, default=2, help="sent in config (2 = auto, as in the UI)")
+    ap.add_argument('--stagger', type=float, default=0.05, help='seconds between session starts')
+    ap.add_argument('--final-timeout', type=float, default=180, help='max wait for the final transcript')
+    ap.add_argument('--cooldown', type=float, default=3, help='pause between ramp steps')
+    ap.add_argument('--json', dest='json_path', help='also write the report to this file')
+    args = ap.parse_args()
+
+    sources = [load_audio(p) for p in args.audio] or [synthetic_audio(args.duration, seed) for seed in range(4)]
+    audios  = [fit_length(a, args.duration) for a in sources]
+
+    proc = spawn_server(args.spawn, args.url) if args.spawn else None
+    try:
+        rows = asyncio.run(main_async(args, audios, proc.pid if proc else args.server_pid))
+    finally:
+        if proc:
+            proc.terminate()
+            proc.wait(timeout=30)
+
+    if args.json_path:
+        with open(args.json_path, 'w', encoding='utf-8') as f:
+            json.dump({'args': {k: v for k, v in vars(args).items() if k != 'json_path'}, 'steps': rows},
+                      f, indent=2)
+        print(f"Report written to {args.json_path}")
+
+
+if __name__ == '__main__':
+    main()